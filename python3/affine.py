@@ -1,4 +1,5 @@
 import typing
+import math
 
 
 class A2(typing.NamedTuple):
@@ -61,3 +62,50 @@ class A2(typing.NamedTuple):
         return A2(-self.m, -self.a)
 
 A2eye = A2(1, 0)
+
+
+class A3(typing.NamedTuple):
+    """Affine map of 3-vectors: x -> m x + a, with m a 3x3 matrix (rows) and a a 3-vector."""
+    m : tuple
+    a : tuple = (0.0, 0.0, 0.0)
+
+    def __call__(self, x):
+        (m0, m1, m2), (a0, a1, a2) = self.m, self.a
+        x0, x1, x2 = x
+        return (
+            m0[0]*x0 + m0[1]*x1 + m0[2]*x2 + a0,
+            m1[0]*x0 + m1[1]*x1 + m1[2]*x2 + a1,
+            m2[0]*x0 + m2[1]*x1 + m2[2]*x2 + a2,
+        )
+
+    def inverse(self):
+        (a, b, c), (d, e, f), (g, h, i) = self.m
+        cofactors = ((e*i - f*h, c*h - b*i, b*f - c*e),
+                     (f*g - d*i, a*i - c*g, c*d - a*f),
+                     (d*h - e*g, b*g - a*h, a*e - b*d))
+        det = a*cofactors[0][0] + b*cofactors[1][0] + c*cofactors[2][0]
+        mi = tuple(tuple(x/det for x in row) for row in cofactors)
+        return A3(mi, tuple(-x for x in A3(mi)(self.a)))
+
+    def hex(self):
+        m = ', '.join('(' + ', '.join(f'float.fromhex({float(x).hex()!r})' for x in row) + ')' for row in self.m)
+        a = ', '.join(f'float.fromhex({float(x).hex()!r})' for x in self.a)
+        return f'{self.__class__.__name__}(m=({m}), a=({a}))'
+
+    @classmethod
+    def linear(cls, m):
+        return cls(tuple(tuple(float(x) for x in row) for row in m))
+
+    @classmethod
+    def diag(cls, x, y, z):
+        """Apply the A2 maps x, y and z to the three components separately."""
+        return cls(((x.m, 0.0, 0.0), (0.0, y.m, 0.0), (0.0, 0.0, z.m)), (x.a, y.a, z.a))
+
+    def isLinear(self):
+        return not any(self.a)
+
+    def __matmul__(self, t):
+        m = tuple(tuple(math.fsum(r[k]*t.m[k][j] for k in range(3)) for j in range(3)) for r in self.m)
+        return A3(m, tuple(x + a for x, a in zip(A3(self.m)(t.a), self.a)))
+
+A3eye = A3(((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)))
@@ -0,0 +1,187 @@
+"""Benchmarks for the conversion paths, with JSON results and regression checks.
+
+Each case times individual calls: one color for the scalar jabz.py paths, one
+batch for the NumPy paths. It reports throughput in pixels/s and the p50, p90
+and p99 latency of a call.
+
+    python3 bench.py --save baseline.json
+    python3 bench.py --baseline baseline.json --threshold 0.2   # exits 1 on a regression
+    python3 bench.py --filter jabznp
+
+A case regresses when its pixels/s falls more than threshold below the
+baseline's. Baselines only compare meaningfully on the same machine. Every
+run also checks the jabznp accuracy tiers against SPEEDUP and exits 1 when a
+tier is not that much faster than exact.
+"""
+
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+import jabz
+import jabzfast
+import jabzfastnp
+import jabznp
+import srgb255ToJzAzBz
+
+
+BATCH = 1 << 16
+
+# Smallest speedup over the same jabznp conversion at accuracy='exact' that
+# each cheaper tier must show. 'lut' only has a table forward.
+SPEEDUP = {
+    'jabznp.srgb255_to_jzazbz fast': 1.5,
+    'jabznp.jzazbz_to_srgb255 fast': 1.3,
+    'jabznp.srgb255_to_jzazbz lut': 1.5,
+}
+
+
+class Case:
+    def __init__(self, name, call, pixels, inputs):
+        """call(x) converts inputs[i] with pixels pixels; calls cycle through inputs."""
+        self.name = name
+        self.call = call
+        self.pixels = pixels
+        self.inputs = inputs
+
+
+def cases(seed=0, batch=BATCH):
+    rng = np.random.default_rng(seed)
+    srgb = rng.integers(0, 256, size=(batch, 3))
+    colors = [jabz.SRGB255(*c) for c in srgb[:4096].tolist()]
+    jzazbz = [c.jzazbz() for c in colors]
+    jabzs = [c.jabz() for c in colors]
+    jchs = [c.jch() for c in colors]
+    labels = [f'series-{i}' for i in range(4096)]
+    batchJzazbz = jabznp.srgb255_to_jzazbz(srgb)
+    batchJch = jabznp.srgb255_to_jch(srgb)
+    columns = srgb.T.astype(np.float64)
+
+    yield Case('scalar SRGB255.jzazbz', lambda c: c.jzazbz(), 1, colors)
+    yield Case('scalar Jabz.srgb255', lambda c: c.srgb255(), 1, jabzs)
+    yield Case('scalar Jch.srgb255', lambda c: c.srgb255(), 1, jchs)
+    yield Case('scalar JzAzBz.xyz100', lambda c: c.xyz100(), 1, jzazbz)
+    yield Case('scalar jchzHash', lambda st: jabz.jchzHash(0.6, 0.5, st), 1, labels)
+    yield Case('scalar srgb255ToJzAzBz (hand-folded)', lambda c: srgb255ToJzAzBz.srgb255ToJzAzBz(*c), 1, colors)
+    yield Case('scalar jabzfast.srgb255ToJzAzBz', lambda c: jabzfast.srgb255ToJzAzBz(*c), 1, colors)
+    yield Case('scalar jabzfast.jzazbzToSrgb255', lambda c: jabzfast.jzazbzToSrgb255(*c), 1, jzazbz)
+    for accuracy in jabznp.ACCURACY:
+        yield Case(f'jabznp.srgb255_to_jzazbz {accuracy}', lambda a, accuracy=accuracy: jabznp.srgb255_to_jzazbz(a, accuracy), batch, [srgb])
+        if accuracy != 'lut':
+            yield Case(f'jabznp.jzazbz_to_srgb255 {accuracy}', lambda a, accuracy=accuracy: jabznp.jzazbz_to_srgb255(a, accuracy), batch, [batchJzazbz])
+    yield Case('jabznp.jch_to_srgb255', jabznp.jch_to_srgb255, batch, [batchJch])
+    yield Case('jabzfastnp.srgb255ToJzAzBz', lambda a: jabzfastnp.srgb255ToJzAzBz(*a), batch, [columns])
+    yield Case('jabznp.jchzHash', lambda st: jabznp.jchzHash(0.6, 0.5, st), len(labels), [labels])
+
+
+def run(case, seconds=0.5, minCalls=5, warmup=3):
+    """Time calls until seconds have passed (and at least minCalls were made)."""
+    inputs = case.inputs
+    for i in range(warmup):
+        case.call(inputs[i % len(inputs)])
+    times = []
+    start = time.perf_counter()
+    i = 0
+    clock = time.perf_counter_ns
+    while len(times) < minCalls or time.perf_counter() - start < seconds:
+        x = inputs[i % len(inputs)]
+        t0 = clock()
+        case.call(x)
+        times.append(clock() - t0)
+        i += 1
+    ns = np.array(times, dtype=np.float64)
+    p50, p90, p99 = np.percentile(ns, [50, 90, 99])/1e3
+    return {
+        'pixels_per_s': case.pixels*len(ns)/(ns.sum()/1e9),
+        'p50_us': p50,
+        'p90_us': p90,
+        'p99_us': p99,
+        'calls': len(ns),
+        'pixels_per_call': case.pixels,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Names of cases whose throughput fell more than threshold below the baseline's."""
+    regressions = []
+    for name, r in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = r['pixels_per_s']/old['pixels_per_s']
+        flag = ''
+        if ratio < 1 - threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:44} {ratio:6.2f}x baseline{flag}')
+    return regressions
+
+
+def checkSpeedups(results):
+    """Names of SPEEDUP cases that are not their bound times faster than exact; cases not run are skipped."""
+    slow = []
+    for name, bound in SPEEDUP.items():
+        exact = results.get(name.rsplit(' ', 1)[0] + ' exact')
+        if name not in results or exact is None:
+            continue
+        speedup = results[name]['pixels_per_s']/exact['pixels_per_s']
+        flag = ''
+        if speedup < bound:
+            slow.append(name)
+            flag = '  TOO SLOW'
+        print(f'{name:44} {speedup:6.2f}x exact (bound {bound}x){flag}')
+    return slow
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='bench.py', description='Benchmark the jabz conversion paths.')
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--seconds', type=float, default=0.5, help='time spent on each case (default: 0.5)')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed fractional throughput loss (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f'{"case":44} {"Mpixel/s":>10} {"p50 us":>10} {"p90 us":>10} {"p99 us":>10}')
+    for case in cases():
+        if args.filter and args.filter not in case.name:
+            continue
+        r = results[case.name] = run(case, args.seconds)
+        print(f'{case.name:44} {r["pixels_per_s"]/1e6:10.3f} {r["p50_us"]:10.1f} {r["p90_us"]:10.1f} {r["p99_us"]:10.1f}')
+
+    slow = checkSpeedups(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'{len(regressions)} case(s) regressed by more than {args.threshold:.0%}', file=sys.stderr)
+            return 1
+    if slow:
+        print(f'{len(slow)} accuracy tier(s) slower than SPEEDUP allows', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
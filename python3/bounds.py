@@ -0,0 +1,426 @@
+"""Bounds of JzAzBz and JzCzHz over the whole sRGB cube, by interval arithmetic.
+
+jabz.findJabBounds and findJchBounds sample colors, so the ranges behind jz2j,
+az2a, bz2b, JzCzHz_jz1 and JzCzHz_cz1 are only as good as the sample. Here the
+forward kernel that srgb255ToJzAzBz.py folds from the jabz.py conversion is
+evaluated on boxes of sRGB255 values with outward-rounded interval arithmetic,
+carrying interval gradients along. A branch-and-bound search splits the boxes
+until every extremum is enclosed in [lower, upper] with upper - lower <=
+tolerance. The lower bound of a maximum is reached by a color and the upper
+bound holds for every color in the cube, for the exact real-valued conversion;
+the float code differs from it by a few ulps.
+
+    python3 bounds.py            # print the bounds and the jabz.py constants
+    python3 bounds.py --write    # and replace the constants in jabz.py
+"""
+
+import math
+import re
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+
+import srgb255ToJzAzBz as folded
+from affine import A2
+from srgb255ToJzAzBz import Var, Num, Inv, Neg, Mul, Add, Pow, Le, Where, Max
+
+
+CUBE = ((0.0, 255.0),)*3
+PARAMS = ('sr', 'sg', 'sb')
+
+# Intervals are (lo, hi) pairs of floats or of NumPy arrays, one element per
+# box, so a whole batch of boxes is evaluated in one pass.
+
+
+def down(x):
+    return np.nextafter(x, -math.inf)
+
+
+def up(x):
+    return np.nextafter(x, math.inf)
+
+
+def hull(x, y):
+    return (np.minimum(x[0], y[0]), np.maximum(x[1], y[1]))
+
+
+def iNum(value):
+    f = float(value)
+    d = Decimal(f)
+    return (f if d <= value else math.nextafter(f, -math.inf), f if d >= value else math.nextafter(f, math.inf))
+
+
+def iAdd(*xs):
+    lo, hi = xs[0]
+    for x in xs[1:]:
+        lo = down(lo + x[0])
+        hi = up(hi + x[1])
+    if len(xs) > 1:
+        # inf - inf: the sum could be anything.
+        lo = np.where(lo != lo, -math.inf, lo)
+        hi = np.where(hi != hi, math.inf, hi)
+    return (lo, hi)
+
+
+def iNeg(x):
+    return (-x[1], -x[0])
+
+
+def iMul(x, y):
+    ps = [x[0]*y[0], x[0]*y[1], x[1]*y[0], x[1]*y[1]]
+    # 0*inf only comes from an exactly zero derivative, so it is 0.
+    ps = [np.where(p != p, 0.0, p) for p in ps]
+    return (down(np.minimum.reduce(ps)), up(np.maximum.reduce(ps)))
+
+
+def iSquare(x):
+    a, b = x[0]*x[0], x[1]*x[1]
+    lo = np.where((x[0] <= 0) & (x[1] >= 0), 0.0, down(np.minimum(a, b)))
+    return (lo, up(np.maximum(a, b)))
+
+
+def iInv(x):
+    finite = (x[0] > 0) | (x[1] < 0)
+    return (np.where(finite, down(1/x[1]), -math.inf), np.where(finite, up(1/x[0]), math.inf))
+
+
+def iPow(x, y):
+    # A base is only ever a sum of nonnegative terms here, so any
+    # overestimation below zero is clipped.
+    lo, hi = np.maximum(x[0], 0.0), np.maximum(x[1], 0.0)
+    ps = [a**p for a in (lo, hi) for p in y]
+    a, b = np.minimum.reduce(ps), np.maximum.reduce(ps)
+    # Allow for pow being faithfully rounded.
+    return (np.maximum(a - 4*np.spacing(a), 0.0), np.where(b < math.inf, b + 4*np.spacing(b), b))
+
+
+def iLe(x, y):
+    """(surely true, surely false) masks of x <= y."""
+    return (x[1] <= y[0], x[0] > y[1])
+
+
+# Values are (interval, gradient): the gradient holds an interval for the
+# derivative by each of the three parameters.
+
+ZERO = (0.0, 0.0)
+NO_GRADIENT = (ZERO, ZERO, ZERO)
+
+
+def dConst(v):
+    return (v, NO_GRADIENT)
+
+
+def dVar(v, i):
+    return (v, tuple((1.0, 1.0) if j == i else ZERO for j in range(3)))
+
+
+def dAdd(*xs):
+    return (iAdd(*(x[0] for x in xs)), tuple(iAdd(*(x[1][i] for x in xs)) for i in range(3)))
+
+
+def dNeg(x):
+    return (iNeg(x[0]), tuple(map(iNeg, x[1])))
+
+
+def dMul(x, y):
+    return (iMul(x[0], y[0]), tuple(iAdd(iMul(dx, y[0]), iMul(x[0], dy)) for dx, dy in zip(x[1], y[1])))
+
+
+def dSquare(x):
+    two = iMul((2.0, 2.0), x[0])
+    return (iSquare(x[0]), tuple(iMul(two, dx) for dx in x[1]))
+
+
+def dInv(x):
+    r = iInv(x[0])
+    d = iNeg(iSquare(r))
+    return (r, tuple(iMul(d, dx) for dx in x[1]))
+
+
+def dPow(x, y):
+    if y[1] is not NO_GRADIENT:
+        raise ValueError('only constant exponents are supported')
+    p = y[0]
+    d = iMul(p, iPow(x[0], iAdd(p, (-1.0, -1.0))))
+    return (iPow(x[0], p), tuple(iMul(d, dx) for dx in x[1]))
+
+
+def iPick(c, x, y):
+    true, false = c
+    return (np.where(true, x[0], np.where(false, y[0], np.minimum(x[0], y[0]))),
+            np.where(true, x[1], np.where(false, y[1], np.maximum(x[1], y[1]))))
+
+
+def dWhere(c, x, y):
+    # Where the condition is unknown the curves meet inside the box, so hulls
+    # of the branches' values and derivatives enclose the function and its
+    # slopes.
+    return (iPick(c, x[0], y[0]), tuple(iPick(c, a, b) for a, b in zip(x[1], y[1])))
+
+
+def dMax(x, y):
+    return dWhere(iLe(y[0], x[0]), x, y)
+
+
+rules = {
+    Num: lambda e, cs, env: dConst(iNum(e.value)),
+    Var: lambda e, cs, env: env[e.symbol],
+    Add: lambda e, cs, env: dAdd(*cs),
+    Mul: lambda e, cs, env: dMul(*cs),
+    Inv: lambda e, cs, env: dInv(*cs),
+    Neg: lambda e, cs, env: dNeg(*cs),
+    Pow: lambda e, cs, env: dPow(*cs),
+    Le: lambda e, cs, env: iLe(cs[0][0], cs[1][0]),
+    Where: lambda e, cs, env: dWhere(*cs),
+    Max: lambda e, cs, env: dMax(*cs),
+}
+
+
+def affine(e):
+    """(y, a, b) when e is a*y + b for constants a and b, else None."""
+    terms = list(e.addends())
+    b = Decimal(0)
+    if len(terms) == 2 and isinstance(terms[1], Num):
+        b = terms[1].value
+        e = terms[0]
+    elif len(terms) != 1:
+        return None
+    if isinstance(e, Mul) and isinstance(e.y, Num):
+        return (e.x, e.y.value, b)
+    return None
+
+
+def mobius(e):
+    """(y, a, b, c, d) when e is (a*y + b)/(c*y + d), else None.
+
+    Dividing the two sums as intervals loses that both move with y
+    together; the PQ curve's ratio is monotone in y and far tighter evaluated
+    at the ends of y's interval.
+    """
+    if not (isinstance(e, Mul) and isinstance(e.y, Inv)):
+        return None
+    u, v = affine(e.x), affine(e.y.e)
+    if u is None or v is None or u[0] is not v[0]:
+        return None
+    return (u[0], *u[1:], *v[1:])
+
+
+def mobiusRule(a, b, c, d):
+    a, b, c, d = map(iNum, (a, b, c, d))
+    slope = iAdd(iMul(a, d), iNeg(iMul(b, c)))
+
+    def at(y):
+        return iMul(iAdd(iMul(a, y), b), iInv(iAdd(iMul(c, y), d)))
+
+    def rule(e, cs, env):
+        y, dy = cs[0]
+        denominator = iAdd(iMul(c, y), d)
+        pole = (denominator[0] <= 0) & (denominator[1] >= 0)
+        value = iPick((~pole, pole), hull(at((y[0], y[0])), at((y[1], y[1]))), at(y))
+        dydx = iMul(slope, iSquare(iInv(denominator)))
+        return (value, tuple(iMul(dydx, g) for g in dy))
+    return rule
+
+
+class IntervalProgram:
+    """The expression DAG of some roots, flattened once into evaluation order."""
+
+    def __init__(self, roots):
+        order = []
+        index = {}
+        stack = [(root, False) for root in roots]
+        while stack:
+            e, visited = stack.pop()
+            if e in index:
+                continue
+            if visited:
+                index[e] = len(order)
+                order.append(e)
+                continue
+            stack.append((e, True))
+            stack += ((c, False) for c in e.children() if c not in index)
+        self.nodes = []
+        for e in order:
+            m = mobius(e)
+            if m:
+                self.nodes.append((mobiusRule(*m[1:]), e, (index[m[0]],)))
+            else:
+                self.nodes.append((rules[type(e)], e, tuple(index[c] for c in e.children())))
+        self.roots = [index[r] for r in roots]
+
+    def __call__(self, lo, hi):
+        """Value and gradient of each root over the (N, 3) boxes lo..hi."""
+        env = {p: dVar((lo[:, i], hi[:, i]), i) for i, p in enumerate(PARAMS)}
+        values = []
+        with np.errstate(all='ignore'):
+            for rule, e, children in self.nodes:
+                values.append(rule(e, [values[i] for i in children], env))
+        return [values[i] for i in self.roots]
+
+
+def jzazbzProgram():
+    roots, names = folded.inline(folded.forwardKernel())
+    return IntervalProgram(roots)
+
+
+# name: (function of the jz, az, bz values, sign: +1 to find the maximum, -1 the minimum)
+# Chroma is bounded through its square, which has no square root at zero.
+objectives = {
+    'jz0': (lambda jz, az, bz: jz, -1),
+    'jz1': (lambda jz, az, bz: jz, 1),
+    'az0': (lambda jz, az, bz: az, -1),
+    'az1': (lambda jz, az, bz: az, 1),
+    'bz0': (lambda jz, az, bz: bz, -1),
+    'bz1': (lambda jz, az, bz: bz, 1),
+    'cz1': (lambda jz, az, bz: dAdd(dSquare(az), dSquare(bz)), 1),
+}
+
+
+def enclose(f, lo, hi):
+    """Upper bounds of f over the boxes lo..hi, with each box shrunk to the faces f increases towards.
+
+    The upper bound is the tighter of the plain interval value and the mean
+    value form f(center) + gradient . (box - center). Also returns f's lower
+    bound at each box's center, a value some color reaches.
+    """
+    n = len(lo)
+    with np.errstate(invalid='ignore'):
+        while True:
+            c = (lo + hi)/2
+            (value, gradient) = f(np.concatenate([lo, c]), np.concatenate([hi, c]))
+            at = value[0][n:]
+            mean = iAdd((at, value[1][n:]), *(iMul((g[0][:n], g[1][:n]), (lo[:, i] - c[:, i], hi[:, i] - c[:, i])) for i, g in enumerate(gradient)))
+            upper = np.minimum(value[1][:n], mean[1])
+            # Where f is monotone along a side its maximum is on that face.
+            rising = np.stack([g[0][:n] >= 0 for g in gradient], axis=-1)
+            falling = np.stack([g[1][:n] <= 0 for g in gradient], axis=-1) & ~rising
+            newLo = np.where(rising, hi, lo)
+            newHi = np.where(falling, lo, hi)
+            if np.array_equal(newLo, lo) and np.array_equal(newHi, hi):
+                return upper, lo, hi, at, c
+            lo, hi = newLo, newHi
+
+
+def maximize(f, box=CUBE, tolerance=1e-12, batch=512, maxBoxes=1 << 22):
+    """Enclose the maximum of f over box: (lower, upper, witness point).
+
+    f maps (N, 3) arrays of box corners to (interval, gradient). Each round
+    splits the batch of boxes with the highest upper bounds in half along
+    their widest side; a box is dropped once its upper bound falls below the
+    best value some color is known to reach.
+    """
+    lo = np.array([[b[0] for b in box]])
+    hi = np.array([[b[1] for b in box]])
+    upper, lo, hi, at, c = enclose(f, lo, hi)
+    best, witness = at[0], c[0]
+    boxes = 1
+    while True:
+        keep = upper > best
+        upper, lo, hi = upper[keep], lo[keep], hi[keep]
+        if not len(upper) or upper.max() - best <= tolerance or boxes >= maxBoxes:
+            top = max(best, upper.max()) if len(upper) else best
+            return best, top, tuple(witness.tolist())
+        order = np.argsort(-upper)
+        pick, rest = order[:batch], order[batch:]
+        plo, phi = lo[pick], hi[pick]
+        side = np.argmax(phi - plo, axis=1)
+        rows = np.arange(len(pick))
+        mid = (plo[rows, side] + phi[rows, side])/2
+        leftHi, rightLo = phi.copy(), plo.copy()
+        leftHi[rows, side] = mid
+        rightLo[rows, side] = mid
+        u, l, h, at, c = enclose(f, np.concatenate([plo, rightLo]), np.concatenate([leftHi, phi]))
+        boxes += len(u)
+        i = np.argmax(at)
+        if at[i] > best:
+            best, witness = at[i], c[i]
+        upper = np.concatenate([upper[rest], u])
+        lo = np.concatenate([lo[rest], l])
+        hi = np.concatenate([hi[rest], h])
+
+
+def bounds(tolerance=1e-12):
+    """{name: (lower, upper, sRGB255 witness)} for each of objectives."""
+    program = jzazbzProgram()
+    result = {}
+    for name, (g, sign) in objectives.items():
+        def f(lo, hi, g=g, sign=sign):
+            v = g(*program(lo, hi))
+            return v if sign > 0 else dNeg(v)
+        lower, upper, witness = maximize(f, tolerance=tolerance)
+        if sign < 0:
+            lower, upper = -upper, -lower
+        result[name] = (float(lower), float(upper), witness)
+    lower, upper, witness = result['cz1']
+    result['cz1'] = (math.nextafter(math.sqrt(lower), -math.inf), math.nextafter(math.sqrt(upper), math.inf), witness)
+    return result
+
+
+def snap(lo, hi):
+    """(lo, hi) with ends within a few ulps (at the range's scale) of 0 set to 0: interval noise around an exact 0."""
+    ulps = 4*math.ulp(max(abs(lo), abs(hi)))
+    return (0.0 if abs(lo) <= ulps else lo), (0.0 if abs(hi) <= ulps else hi)
+
+
+def constants(b):
+    """jabz.py's constants from bounds: each range is widened to its outer bound."""
+    jz0, jz1 = snap(b['jz0'][0], b['jz1'][1])
+    az0, az1 = snap(b['az0'][0], b['az1'][1])
+    bz0, bz1 = snap(b['bz0'][0], b['bz1'][1])
+    j, a, bb = A2.norm(jz0, jz1), A2.norm(az0, az1), A2.norm(bz0, bz1)
+    return {
+        'jz2j': j.hex(),
+        'az2a': a.hex(),
+        'bz2b': bb.hex(),
+        'j2jz': j.inverse().hex(),
+        'a2az': a.inverse().hex(),
+        'b2bz': bb.inverse().hex(),
+        'JzCzHz_jz1': f'float.fromhex({jz1.hex()!r})',
+        'JzCzHz_cz1': f'float.fromhex({b["cz1"][1].hex()!r})',
+    }
+
+
+def writeConstants(path, code):
+    with open(path) as f:
+        source = f.read()
+    for name, value in code.items():
+        source, n = re.subn(rf'^{name} = .*$', f'{name} = {value}', source, flags=re.MULTILINE)
+        if n != 1:
+            raise ValueError(f'expected one definition of {name} in {path}, found {n}')
+    with open(path, 'w') as f:
+        f.write(source)
+
+
+def main(argv):
+    import argparse
+    import os
+
+    import jabz
+
+    parser = argparse.ArgumentParser(prog='bounds.py', description='Bound JzAzBz and JzCzHz over the sRGB cube by interval arithmetic.')
+    parser.add_argument('--tolerance', type=float, default=1e-12, help='largest upper - lower for each extremum (default: 1e-12)')
+    parser.add_argument('--write', action='store_true', help='replace the constants in jabz.py')
+    args = parser.parse_args(argv)
+
+    t = time.perf_counter()
+    b = bounds(args.tolerance)
+    print(f'{time.perf_counter() - t:.1f}s')
+    for name, (lower, upper, witness) in b.items():
+        print(f'{name}: [{lower!r}, {upper!r}] at sRGB255 {witness}')
+
+    code = constants(b)
+    for name, value in code.items():
+        current = getattr(jabz, name)
+        new = eval(value, {'A2': A2})
+        old = current if isinstance(current, tuple) else (current,)
+        new = new if isinstance(new, tuple) else (new,)
+        print(f'{name} = {value}')
+        print(f'    # {max(abs(n - o)/abs(o or 1.0) for n, o in zip(new, old)):.1e} relative difference from the current value')
+    if args.write:
+        writeConstants(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jabz.py'), code)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
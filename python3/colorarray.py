@@ -0,0 +1,231 @@
+"""ColorArray: a batch of colors in one NumPy buffer, tagged with its space.
+
+It has the conversion methods of the jabz.py classes (.srgb255(), .jzazbz(),
+.jch(), ...) but each call converts the whole batch with jabznp instead of
+allocating a NamedTuple per pixel and per step:
+
+    ColorArray(pixels, 'srgb255').jch()
+    ColorArray.fromColors([jabz.Jch(0.5, 0.3, h/12) for h in range(12)]).srgb255()
+
+The colors are stored interleaved, as one (..., 3) float64 array with each
+color's components adjacent, rather than as three component columns: that is
+the layout of (H, W, 3) images and of every jabznp function, so wrapping
+pixels and converting them never copies to change layout.
+
+Slicing gives views of the same buffer, and __array__/__array_interface__ let
+NumPy and PIL read it without a copy. memoryview() and other buffer-protocol
+consumers need Python 3.12 (PEP 688) to see __buffer__; on older versions
+__buffer__ raises TypeError, and consumers should be passed
+np.asarray(colors) or colors.data instead.
+"""
+
+import collections
+import sys
+
+import numpy as np
+
+import jabz
+import jabznp
+
+
+classes = {
+    'srgb255': jabz.SRGB255,
+    'srgb1': jabz.SRGB1,
+    'rgb1': jabz.RGB1,
+    'xyz1': jabz.XYZ1,
+    'xyz100': jabz.XYZ100,
+    'jzazbz': jabz.JzAzBz,
+    'jzczhz': jabz.JzCzhz,
+    'jch': jabz.Jch,
+    'jabz': jabz.Jabz,
+}
+
+spaces = {cls: space for space, cls in classes.items()}
+
+# Single conversion steps; accuracy is passed to the ones through the PQ curves.
+steps = {
+    ('srgb255', 'srgb1'): lambda a, accuracy: a/255,
+    ('srgb1', 'srgb255'): lambda a, accuracy: a*255,
+    ('srgb1', 'rgb1'): lambda a, accuracy: jabznp.srgb1_to_rgb1(a),
+    ('rgb1', 'srgb1'): lambda a, accuracy: jabznp.rgb1_to_srgb1(a),
+    ('rgb1', 'xyz1'): lambda a, accuracy: jabznp.rgb1_to_xyz100(a)/100,
+    ('xyz1', 'rgb1'): lambda a, accuracy: jabznp.xyz100_to_rgb1(a*100),
+    ('xyz1', 'xyz100'): lambda a, accuracy: a*100,
+    ('xyz100', 'xyz1'): lambda a, accuracy: a/100,
+    ('xyz100', 'jzazbz'): jabznp.xyz100_to_jzazbz,
+    ('jzazbz', 'xyz100'): jabznp.jzazbz_to_xyz100,
+    ('jzazbz', 'srgb255'): jabznp.jzazbz_to_srgb255,
+    ('jzazbz', 'jzczhz'): lambda a, accuracy: jabznp.jzazbz_to_jzczhz(a),
+    ('jzczhz', 'jzazbz'): lambda a, accuracy: jabznp.jzczhz_to_jzazbz(a),
+    ('jzczhz', 'jch'): lambda a, accuracy: jabznp.jzczhz_to_jch(a),
+    ('jch', 'jzczhz'): lambda a, accuracy: jabznp.jch_to_jzczhz(a),
+    ('jzazbz', 'jabz'): lambda a, accuracy: jabznp.jzazbz_to_jabz(a),
+    ('jabz', 'jzazbz'): lambda a, accuracy: jabznp.jabz_to_jzazbz(a),
+}
+
+
+def route(src, dst, edges=steps):
+    """Shortest chain of steps (keys of edges) from src to dst."""
+    previous = {src: None}
+    queue = collections.deque([src])
+    while queue:
+        space = queue.popleft()
+        if space == dst:
+            break
+        for a, b in edges:
+            if a == space and b not in previous:
+                previous[b] = space
+                queue.append(b)
+    if dst not in previous:
+        raise ValueError(f'no conversion from {src!r} to {dst!r}')
+    path = [dst]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    return list(zip(path[::-1], path[-2::-1]))
+
+
+class ColorArray:
+    __slots__ = ('data', 'space')
+
+    def __init__(self, data, space):
+        if space not in classes:
+            raise ValueError(f'unknown color space {space!r}, expected one of {sorted(classes)}')
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim < 1 or data.shape[-1] != 3:
+            raise ValueError(f'expected an array of shape (..., 3), got {data.shape}')
+        self.data = data
+        self.space = space
+
+    @classmethod
+    def fromColors(cls, colors):
+        """Pack jabz.py NamedTuples, all of one class, into a ColorArray."""
+        colors = list(colors)
+        if not colors:
+            raise ValueError('no colors to infer a space from')
+        kinds = {type(c) for c in colors}
+        if len(kinds) != 1 or not kinds <= spaces.keys():
+            raise TypeError(f'expected colors of a single jabz.py class, got {sorted(k.__name__ for k in kinds)}')
+        return cls(np.array(colors, dtype=np.float64), spaces[kinds.pop()])
+
+    def convert(self, space, accuracy='exact'):
+        data = self.data
+        for a, b in route(self.space, space):
+            data = steps[a, b](data, accuracy)
+        return ColorArray(data, space)
+
+    def srgb255(self, accuracy='exact'):
+        return self.convert('srgb255', accuracy)
+
+    def srgb1(self, accuracy='exact'):
+        return self.convert('srgb1', accuracy)
+
+    def rgb1(self, accuracy='exact'):
+        return self.convert('rgb1', accuracy)
+
+    def xyz1(self, accuracy='exact'):
+        return self.convert('xyz1', accuracy)
+
+    def xyz100(self, accuracy='exact'):
+        return self.convert('xyz100', accuracy)
+
+    def jzazbz(self, accuracy='exact'):
+        return self.convert('jzazbz', accuracy)
+
+    def jzczhz(self, accuracy='exact'):
+        return self.convert('jzczhz', accuracy)
+
+    def jch(self, accuracy='exact'):
+        return self.convert('jch', accuracy)
+
+    def jabz(self, accuracy='exact'):
+        return self.convert('jabz', accuracy)
+
+    @property
+    def shape(self):
+        return self.data.shape[:-1]
+
+    def __len__(self):
+        """Colors along the first axis; a single color has no length, like a 0-d array."""
+        if self.data.ndim == 1:
+            raise TypeError('len() of a single color')
+        return len(self.data)
+
+    def __getitem__(self, key):
+        """A jabz.py NamedTuple for a single color, otherwise a ColorArray view."""
+        data = self.data[key]
+        if data.ndim == 1:
+            return classes[self.space](*data.tolist())
+        return ColorArray(data, self.space)
+
+    def __iter__(self):
+        cls = classes[self.space]
+        return (cls(*c) for c in self.data.reshape(-1, 3).tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        if copy:
+            return np.array(self.data, dtype=dtype)
+        return self.data if dtype is None else self.data.astype(dtype, copy=False)
+
+    @property
+    def __array_interface__(self):
+        return self.data.__array_interface__
+
+    if sys.version_info >= (3, 12):
+        def __buffer__(self, flags):
+            return memoryview(self.data)
+    else:
+        def __buffer__(self, flags):
+            raise TypeError('ColorArray exports the buffer protocol only on Python 3.12 and later (PEP 688); use np.asarray(colors) or colors.data')
+
+    def __repr__(self):
+        return f'ColorArray({self.data!r}, {self.space!r})'
+
+
+def check(n=2000, seed=0):
+    scalar = {
+        'srgb1': lambda c: c.srgb1(),
+        'rgb1': lambda c: c.srgb1().rgb1(),
+        'xyz1': lambda c: c.srgb1().rgb1().xyz1(),
+        'xyz100': lambda c: c.srgb1().rgb1().xyz1().xyz100(),
+        'jzazbz': lambda c: c.jzazbz(),
+        'jzczhz': lambda c: c.jzczhz(),
+        'jch': lambda c: c.jch(),
+        'jabz': lambda c: c.jabz(),
+    }
+    rng = np.random.default_rng(seed)
+    srgb = ColorArray(rng.integers(0, 256, size=(n, 3)), 'srgb255')
+    for space, f in scalar.items():
+        expected = np.array([f(c) for c in srgb])
+        converted = srgb.convert(space)
+        actual = np.asarray(converted)
+        if space in ('jzczhz', 'jch'):
+            # Hue is ill-conditioned near the neutral axis.
+            actual, expected = actual[:, :2], expected[:, :2]
+        back = np.asarray(converted.srgb255())
+        print(f'{space:7}: max difference from jabz.py {np.abs(actual - expected).max():.1e}, srgb255 round trip {np.abs(back - srgb.data).max():.1e}')
+
+    view = srgb[10:20]
+    assert np.shares_memory(np.asarray(view), srgb.data)
+    assert srgb[3] == jabz.SRGB255(*srgb.data[3].tolist())
+    assert ColorArray.fromColors(list(srgb[:5])).space == 'srgb255'
+    assert len(srgb) == n
+    try:
+        len(ColorArray([0.5, 0.2, 0.1], 'jch'))
+    except TypeError:
+        pass
+    else:
+        raise AssertionError('len() of a single color')
+    if sys.version_info >= (3, 12):
+        buffer = memoryview(view)
+        assert buffer.shape == (10, 3) and buffer.format == 'd'
+    else:
+        try:
+            view.__buffer__(0)
+        except TypeError as e:
+            assert '3.12' in str(e)
+        else:
+            raise AssertionError('__buffer__ before Python 3.12')
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,169 @@
+"""Cross-validate every sRGB255 -> JzAzBz implementation against jabz.py.
+
+Runs the whole 2**24 cube (--full) or a stratified sample (one random color
+in each of strata**3 equal boxes of the cube) through each implementation,
+in chunks spread across worker processes. Each implementation is compared
+against the scalar jabz.py chain and reports:
+
+  - max and mean dEz (JzAzBz.diff) from jabz.py,
+  - max difference in ulps of JzCzHz_jz1, as jabznp.ULP_TOLERANCE counts them,
+  - max sRGB255 round-trip error through its own inverse, where it has one,
+  - forward throughput per core.
+
+    python3 crossval.py --strata 64 --workers 8
+    python3 crossval.py --full --json results.json
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import deltae
+import jabz
+import jabzfast
+import jabzfastnp
+import jabznp
+import srgb255ToJzAzBz
+
+
+CHUNK = 1 << 15
+
+
+def scalarForward(f):
+    return lambda srgb: np.array([f(*c) for c in srgb.tolist()])
+
+
+def scalarInverse(f):
+    return lambda jzazbz: np.array([f(*c) for c in jzazbz.tolist()])
+
+
+def tier(accuracy):
+    return (lambda srgb: jabznp.srgb255_to_jzazbz(srgb, accuracy), lambda jzazbz: jabznp.jzazbz_to_srgb255(jzazbz, accuracy))
+
+
+# name: (forward (N, 3) int sRGB255 -> (N, 3) JzAzBz, inverse back to sRGB255 or None)
+# The reference spells out the NamedTuple chain, since JzAzBz.srgb255 itself
+# goes through jabzfast. srgb255ToJzAzBz.py folds only the forward direction.
+implementations = {
+    'jabz.py': (scalarForward(lambda r, g, b: jabz.SRGB255(r, g, b).jzazbz()), scalarInverse(lambda jz, az, bz: jabz.JzAzBz(jz, az, bz).xyz100().xyz1().rgb1().srgb1().srgb255())),
+    'hand-folded': (scalarForward(srgb255ToJzAzBz.srgb255ToJzAzBz), None),
+    'jabzfast': (scalarForward(jabzfast.srgb255ToJzAzBz), scalarInverse(jabzfast.jzazbzToSrgb255)),
+    'jabzfastnp': (lambda srgb: np.stack(jabzfastnp.srgb255ToJzAzBz(*srgb.T.astype(np.float64)), axis=-1), lambda jzazbz: np.stack(jabzfastnp.jzazbzToSrgb255(*jzazbz.T), axis=-1)),
+    'jabznp exact': tier('exact'),
+    'jabznp fast': tier('fast'),
+    'jabznp lut': tier('lut'),
+}
+
+REFERENCE = 'jabz.py'
+
+
+def stratified(strata, seed=0):
+    """One random color in each of strata**3 equal boxes of the cube."""
+    rng = np.random.default_rng(seed)
+    edges = np.linspace(0, 256, strata + 1)
+    lo, hi = np.floor(edges[:-1]), np.floor(edges[1:])
+    cells = np.stack(np.meshgrid(np.arange(strata), np.arange(strata), np.arange(strata), indexing='ij'), axis=-1).reshape(-1, 3)
+    return np.floor(lo[cells] + rng.random(cells.shape)*(hi[cells] - lo[cells])).astype(np.int64)
+
+
+def cubeColors(start, stop):
+    i = np.arange(start, stop)
+    return np.stack([i >> 16, (i >> 8) & 0xFF, i & 0xFF], axis=-1)
+
+
+def validate(task, names):
+    """Statistics for one chunk: ('range', start, stop) of the cube or ('colors', array)."""
+    srgb = cubeColors(*task[1:]) if task[0] == 'range' else task[1]
+    reference = implementations[REFERENCE][0](srgb)
+    stats = {}
+    for name in names:
+        forward, inverse = implementations[name]
+        t = time.perf_counter()
+        jzazbz = forward(srgb)
+        seconds = time.perf_counter() - t
+        dE = deltae.diff(jzazbz, reference)
+        stats[name] = {
+            'count': len(srgb),
+            'seconds': seconds,
+            'max_dE': float(dE.max()),
+            'sum_dE': float(dE.sum()),
+            'max_ulp': float(jabznp.ulpDiff(jzazbz, reference, jabznp.JzCzHz_jz1).max()),
+            'max_round_trip': float(np.abs(inverse(jzazbz) - srgb).max()) if inverse else None,
+        }
+    return stats
+
+
+def merge(total, stats):
+    for name, s in stats.items():
+        t = total.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_dE': 0.0, 'sum_dE': 0.0, 'max_ulp': 0.0, 'max_round_trip': 0.0})
+        for key in ('count', 'seconds', 'sum_dE'):
+            t[key] += s[key]
+        for key in ('max_dE', 'max_ulp'):
+            t[key] = max(t[key], s[key])
+        if s['max_round_trip'] is None:
+            t['max_round_trip'] = None
+        else:
+            t['max_round_trip'] = max(t['max_round_trip'], s['max_round_trip'])
+
+
+def crossValidate(strata=32, full=False, names=None, workers=None, seed=0):
+    names = list(names or implementations)
+    unknown = set(names) - implementations.keys()
+    if unknown:
+        raise ValueError(f'unknown implementations {sorted(unknown)}, expected some of {list(implementations)}')
+    if full:
+        tasks = [('range', i, min(i + CHUNK, 1 << 24)) for i in range(0, 1 << 24, CHUNK)]
+    else:
+        colors = stratified(strata, seed)
+        tasks = [('colors', colors[i:i + CHUNK]) for i in range(0, len(colors), CHUNK)]
+    if 'jabznp lut' in names:
+        # Build the shared table once here rather than racing in every worker.
+        import jabzlut
+        jabzlut.lut()
+
+    total = {}
+    with ProcessPoolExecutor(workers) as pool:
+        for stats in pool.map(validate, tasks, [names]*len(tasks)):
+            merge(total, stats)
+    for t in total.values():
+        t['mean_dE'] = t.pop('sum_dE')/t['count']
+        t['pixels_per_s'] = t['count']/t['seconds']
+    return total
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='crossval.py', description='Cross-validate sRGB255 -> JzAzBz implementations against jabz.py.')
+    parser.add_argument('--full', action='store_true', help='all 2**24 colors instead of a stratified sample')
+    parser.add_argument('--strata', type=int, default=32, help='boxes per channel for the stratified sample (default: 32)')
+    parser.add_argument('--only', action='append', choices=list(implementations), help='implementations to run (default: all)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    names = args.only or list(implementations)
+    if REFERENCE not in names:
+        names.insert(0, REFERENCE)
+    t = time.perf_counter()
+    total = crossValidate(args.strata, args.full, names, args.workers)
+    wall = time.perf_counter() - t
+
+    print(f'{next(iter(total.values()))["count"]} colors in {wall:.1f}s on {args.workers or os.cpu_count()} workers')
+    print(f'{"implementation":14} {"max dEz":>10} {"mean dEz":>10} {"max ulp":>9} {"round trip":>11} {"Mpixel/s":>9}')
+    for name in names:
+        s = total[name]
+        roundTrip = '-' if s['max_round_trip'] is None else f'{s["max_round_trip"]:.2e}'
+        print(f'{name:14} {s["max_dE"]:10.2e} {s["mean_dE"]:10.2e} {s["max_ulp"]:9.3g} {roundTrip:>11} {s["pixels_per_s"]/1e6:9.3f}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(total, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
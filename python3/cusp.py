@@ -0,0 +1,153 @@
+"""Maximum in-gamut chroma over (j, h) in the normalized Jch space.
+
+The table is a dense (NJ, NH) float64 grid of the largest c for which
+Jch(j, c, h) is inside sRGB, sampled at j = i/(NJ - 1) and h = k/NH, and read
+back with bilinear interpolation (wrapping in h). In-gamut tests and chroma
+clamping then cost a table read instead of a round trip through the inverse
+PQ curve per probe.
+
+Tables are .npy files in jabzlut.cacheDir(); their names carry VERSION, the
+grid shape and jabzlut.fingerprint(), the same hash of the conversion
+constants that names the sRGB255 table.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import jabznp
+import jabzlut
+
+
+VERSION = 1
+
+NJ = 257
+NH = 1024
+
+
+def valid_srgb1(srgb1):
+    return np.all((srgb1 >= 0) & (srgb1 <= 1), axis=-1)
+
+
+def bisectChroma(jch, probes=8, tolerance=1/128, low=None, high=None):
+    """Largest in-gamut chroma at or below each jch's c, to within the bracket left after probes.
+
+    Lanes drop out of the loop as soon as their bracket is narrower than
+    tolerance, so later probes only convert the pixels still searching.
+    """
+    j, c, h = (np.array(x, dtype=np.float64) for x in jabznp.components(jch))
+    low = np.zeros_like(c) if low is None else np.array(low, dtype=np.float64)
+    high = c.copy() if high is None else np.array(high, dtype=np.float64)
+
+    active = np.flatnonzero(high - low >= tolerance)
+    for i in range(probes):
+        if active.size == 0:
+            break
+        mid = low[active] + (high[active] - low[active])/2
+        ok = valid_srgb1(jabznp.jch_to_srgb1(jabznp.stack(j[active], mid, h[active])))
+        low[active[ok]] = mid[ok]
+        high[active[~ok]] = mid[~ok]
+        active = active[high[active] - low[active] >= tolerance]
+    return low
+
+
+def defaultPath(nj=NJ, nh=NH):
+    return jabzlut.cachePath(f'cusp-v{VERSION}-{nj}x{nh}')
+
+
+def buildRows(js, nh, probes=52):
+    j, h = np.meshgrid(js, np.arange(nh)/nh, indexing='ij')
+    # No sRGB color has c above 1, by the definition of JzCzHz_cz1.
+    jch = jabznp.stack(j, np.full_like(j, 1.0), h).reshape(-1, 3)
+    return bisectChroma(jch, probes=probes, tolerance=0).reshape(j.shape)
+
+
+def buildTable(nj=NJ, nh=NH, workers=None):
+    """Bisect every grid point to full precision, a block of j rows per worker process."""
+    js = np.linspace(0, 1, nj)
+    blocks = np.array_split(js, min(nj, 4*(workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(workers) as pool:
+        rows = list(pool.map(buildRows, blocks, [nh]*len(blocks)))
+    return np.concatenate(rows)
+
+
+def saveTable(table, path):
+    def write(tmp):
+        with open(tmp, 'wb') as f:
+            np.save(f, table)
+    return jabzlut.writeAtomically(path, write)
+
+
+class CuspTable:
+    def __init__(self, table):
+        self.table = np.asarray(table, dtype=np.float64)
+        if self.table.ndim != 2 or min(self.table.shape) < 2:
+            raise ValueError(f'expected a 2-D (j, h) grid, got shape {self.table.shape}')
+
+    @classmethod
+    def build(cls, nj=NJ, nh=NH, workers=None):
+        return cls(buildTable(nj, nh, workers))
+
+    @classmethod
+    def load(cls, path=None, nj=NJ, nh=NH, build=True):
+        path = path or defaultPath(nj, nh)
+        table = jabzlut.loadCached(path, (lambda path: saveTable(buildTable(nj, nh), path)) if build else None)
+        if table.shape != (nj, nh):
+            raise ValueError(f'{path}: expected a table of shape {(nj, nh)}, got {table.shape}')
+        return cls(table)
+
+    def save(self, path=None):
+        return saveTable(self.table, path or defaultPath(*self.table.shape))
+
+    def maxChroma(self, j, h):
+        """Bilinear estimate of the largest in-gamut c at each (j, h)."""
+        nj, nh = self.table.shape
+        x = np.clip(np.asarray(j, dtype=np.float64), 0, 1)*(nj - 1)
+        y = np.mod(np.asarray(h, dtype=np.float64), 1)*nh
+        j0 = np.minimum(x.astype(np.intp), nj - 2)
+        h0 = np.minimum(y.astype(np.intp), nh - 1)
+        h1 = (h0 + 1) % nh
+        fj = x - j0
+        fh = y - h0
+        t = self.table
+        top = t[j0, h0] + (t[j0, h1] - t[j0, h0])*fh
+        bottom = t[j0 + 1, h0] + (t[j0 + 1, h1] - t[j0 + 1, h0])*fh
+        return top + (bottom - top)*fj
+
+    def inGamut(self, jch):
+        j, c, h = jabznp.components(jch)
+        return c <= self.maxChroma(j, h)
+
+    def clampChroma(self, jch):
+        j, c, h = jabznp.components(jch)
+        return jabznp.stack(j, np.minimum(c, self.maxChroma(j, h)), h)
+
+
+_table = None
+
+def table():
+    """The default table, loaded (and built if missing) on first use."""
+    global _table
+    if _table is None:
+        _table = CuspTable.load()
+    return _table
+
+
+def check(n=100000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = table()
+    j, h = rng.random(n), rng.random(n)
+    jch = jabznp.stack(j, np.ones(n), h)
+    exact = bisectChroma(jch, probes=52, tolerance=0)
+    error = np.abs(t.maxChroma(j, h) - exact)
+    print(f'max chroma: max error {error.max():.2e}, 99.9th percentile {np.percentile(error, 99.9):.2e}')
+
+    jch = rng.random((n, 3))
+    actual = valid_srgb1(jabznp.jch_to_srgb1(jch))
+    print(f'inGamut agrees with the full conversion for {(t.inGamut(jch) == actual).mean()*100:.3f}% of colors')
+
+
+if __name__ == '__main__':
+    print(defaultPath())
+    check()
@@ -0,0 +1,229 @@
+"""Batch JzAzBz.diff and nearest-palette search over JzAzBz points.
+
+JzAzBz.diff's sqrt(dJz**2 + dCz**2 + dHz**2) equals the Euclidean distance
+between the (jz, az, bz) points, since dCz**2 + dHz**2 = daz**2 + dbz**2. So
+diff below evaluates the same formula as JzAzBz.diff, and PaletteIndex can
+find nearest colors with a plain spatial grid.
+"""
+
+import numpy as np
+
+import jabznp
+
+
+# Queries still unresolved after this many rings of cells go to bruteNearest,
+# and queries are processed this many at a time, to bound the candidate arrays.
+MAX_RING = 4
+QUERY_CHUNK = 1 << 12
+
+
+def diff(a, b):
+    """JzAzBz.diff of (..., 3) arrays a and b, paired element by element (broadcasting)."""
+    jz1, az1, bz1 = jabznp.components(a)
+    jz2, az2, bz2 = jabznp.components(b)
+    c1 = np.hypot(az1, bz1)
+    c2 = np.hypot(az2, bz2)
+    h = np.arctan2(bz1, az1) - np.arctan2(bz2, az2)
+    H = 2*np.sqrt(c1*c2)*np.sin(h/2)
+    return np.sqrt((jz1 - jz2)**2 + (c1 - c2)**2 + H**2)
+
+
+def pairwiseDiff(a, b):
+    """(N, M) array of diff(a[i], b[j]) for (N, 3) a and (M, 3) b."""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return np.sqrt(np.sum((a[:, np.newaxis, :] - b[np.newaxis, :, :])**2, axis=-1))
+
+
+def bruteNearest(points, palette, k=1):
+    """Nearest k palette entries by full distance matrices, about 2**18 distances at a time."""
+    points = np.asarray(points, dtype=np.float64)
+    palette = np.asarray(palette, dtype=np.float64)
+    chunk = max(1, (1 << 18)//len(palette))
+    index = np.empty((len(points), k), dtype=np.intp)
+    distance = np.empty((len(points), k))
+    for i in range(0, len(points), chunk):
+        d = pairwiseDiff(points[i:i + chunk], palette)
+        nearest = np.argpartition(d, k - 1, axis=1)[:, :k] if k < d.shape[1] else np.tile(np.arange(d.shape[1]), (len(d), 1))
+        dk = np.take_along_axis(d, nearest, axis=1)
+        order = np.argsort(dk, axis=1, kind='stable')
+        index[i:i + chunk] = np.take_along_axis(nearest, order, axis=1)
+        distance[i:i + chunk] = np.take_along_axis(dk, order, axis=1)
+    return index, distance
+
+
+class PaletteIndex:
+    """Uniform grid over palette colors in JzAzBz for nearest-color queries by dEz.
+
+    Points are bucketed into cubic cells about perCell to a cell, stored in
+    cell order with a start offset per cell. A query scans shells of cells
+    around its own, one Chebyshev ring at a time, and stops once its k-th
+    best distance is no larger than the distance to the next ring. Queries
+    still open after MAX_RING rings fall back to bruteNearest. Repeated colors
+    are indexed once and expanded to their palette entries, in palette order,
+    after the search.
+    """
+
+    def __init__(self, palette, perCell=2):
+        self.palette = np.asarray(palette, dtype=np.float64)
+        if self.palette.ndim != 2 or self.palette.shape[1] != 3 or len(self.palette) == 0:
+            raise ValueError(f'expected a non-empty (M, 3) palette, got {self.palette.shape}')
+        # The grid holds each distinct color once; copies[copyStarts[i]:copyStarts[i + 1]]
+        # are the palette indices of distinct color i, in palette order.
+        self.distinct, inverse, counts = np.unique(self.palette, axis=0, return_inverse=True, return_counts=True)
+        self.copies = np.argsort(inverse.reshape(-1), kind='stable')
+        self.copyStarts = np.r_[0, np.cumsum(counts)]
+        self.lo = self.distinct.min(axis=0)
+        extent = np.maximum(self.distinct.max(axis=0) - self.lo, 1e-12)
+        # Start from the bounding box volume, then shrink the cells until the
+        # occupied ones hold about perCell colors: a gamut fills only part
+        # of its box. Flat palettes are capped at 256 cells an axis.
+        self.cell = float(np.cbrt(np.prod(extent)*perCell/len(self.distinct)))
+        for i in range(4):
+            self.setCell(self.cell, extent)
+            occupancy = len(self.distinct)/len(np.unique(self.cellIds(self.cellCoords(self.distinct))))
+            if occupancy < 2*perCell:
+                break
+            self.cell /= np.cbrt(occupancy/perCell)
+        self.setCell(self.cell, extent)
+        cells = self.cellIds(self.cellCoords(self.distinct))
+        self.order = np.argsort(cells, kind='stable')
+        self.points = self.distinct[self.order]
+        self.starts = np.searchsorted(cells[self.order], np.arange(np.prod(self.dims) + 1))
+
+    def setCell(self, cell, extent):
+        self.cell = max(cell, extent.max()/256)
+        self.dims = np.floor(extent/self.cell).astype(np.intp) + 1
+
+    def cellCoords(self, points):
+        return np.clip(np.floor((points - self.lo)/self.cell).astype(np.intp), 0, self.dims - 1)
+
+    def cellIds(self, coords):
+        return (coords[:, 0]*self.dims[1] + coords[:, 1])*self.dims[2] + coords[:, 2]
+
+    def shell(self, r):
+        """Cell offsets at Chebyshev distance exactly r that can land inside the grid."""
+        axes = [np.arange(-min(r, n - 1), min(r, n - 1) + 1) for n in self.dims]
+        offsets = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        return offsets[np.abs(offsets).max(axis=1) == r]
+
+    def nearest(self, points, k=1):
+        """(indices, distances) of the k nearest palette entries to each (N, 3) point, nearest first."""
+        points = np.asarray(points, dtype=np.float64)
+        shape = points.shape[:-1]
+        points = points.reshape(-1, 3)
+        k = min(k, len(self.palette))
+        index = np.empty((len(points), k), dtype=np.intp)
+        distance = np.empty((len(points), k))
+        for i in range(0, len(points), QUERY_CHUNK):
+            index[i:i + QUERY_CHUNK], distance[i:i + QUERY_CHUNK] = self.expand(*self.nearestChunk(points[i:i + QUERY_CHUNK], min(k, len(self.distinct))), k)
+        return index.reshape(shape + (k,)), distance.reshape(shape + (k,))
+
+    def expand(self, nearest, distance, k):
+        """The first k palette entries of the copies of each row's nearest distinct colors."""
+        rows = np.arange(len(nearest))[:, np.newaxis]
+        counts = np.minimum(self.copyStarts[nearest + 1] - self.copyStarts[nearest], k)
+        ends = np.cumsum(counts, axis=1)
+        # Entry t of a row is copy t - (ends[j] - counts[j]) of its j-th color.
+        t = np.arange(k)
+        j = (ends[:, np.newaxis, :] <= t[np.newaxis, :, np.newaxis]).sum(axis=-1)
+        copy = t - (ends[rows, j] - counts[rows, j])
+        return self.copies[self.copyStarts[nearest[rows, j]] + copy], distance[rows, j]
+
+    def nearestChunk(self, points, k):
+        n = len(points)
+        best = np.full((n, k), np.inf)
+        bestIndex = np.zeros((n, k), dtype=np.intp)
+        home = self.cellCoords(points)
+        active = np.arange(n)
+        rings = int(self.dims.max())
+        for r in range(min(rings, MAX_RING) + 1):
+            if active.size == 0:
+                break
+            offsets = self.shell(r)
+            coords = home[active, np.newaxis, :] + offsets[np.newaxis, :, :]
+            inside = np.all((coords >= 0) & (coords < self.dims), axis=-1)
+            q, o = np.nonzero(inside)
+            cells = self.cellIds(coords[q, o])
+            counts = self.starts[cells + 1] - self.starts[cells]
+            q = np.repeat(active[q], counts)
+            # Position of each candidate within its cell, added to the cell's start.
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            p = np.repeat(self.starts[cells], counts) + within
+            d = np.sqrt(np.sum((points[q] - self.points[p])**2, axis=-1))
+            self.merge(best, bestIndex, q, self.order[p], d, k)
+            # Anything in ring r + 1 or beyond is at least r cells away.
+            active = active[best[active, k - 1] > r*self.cell]
+        if active.size and rings > MAX_RING:
+            bestIndex[active], best[active] = bruteNearest(points[active], self.distinct, k)
+        return bestIndex, best
+
+    @staticmethod
+    def merge(best, bestIndex, q, index, d, k):
+        """Fold candidates (grouped by query q, in order) into each query's k best.
+
+        Takes the k smallest per group with k rounds of minimum.reduceat
+        rather than sorting every candidate.
+        """
+        if q.size == 0:
+            return
+        starts = np.flatnonzero(np.r_[True, q[1:] != q[:-1]])
+        counts = np.diff(np.r_[starts, len(q)])
+        queries = q[starts]
+        d = d.copy()
+        topD = np.empty((len(starts), k))
+        topI = np.empty((len(starts), k), dtype=np.intp)
+        for j in range(k):
+            m = np.minimum.reduceat(d, starts)
+            hits = np.flatnonzero(d == np.repeat(m, counts))
+            group = np.searchsorted(starts, hits, side='right') - 1
+            first = hits[np.r_[True, group[1:] != group[:-1]]]
+            topD[:, j] = m
+            topI[:, j] = index[first]
+            d[first] = np.inf
+        allD = np.concatenate([best[queries], topD], axis=1)
+        allI = np.concatenate([bestIndex[queries], topI], axis=1)
+        order = np.argsort(allD, axis=1, kind='stable')[:, :k]
+        best[queries] = np.take_along_axis(allD, order, axis=1)
+        bestIndex[queries] = np.take_along_axis(allI, order, axis=1)
+
+def check(n=20000, m=100000, seed=0):
+    import timeit
+
+    import jabz
+
+    rng = np.random.default_rng(seed)
+    a = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(200, 3)))
+    b = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(200, 3)))
+    expected = np.array([jabz.JzAzBz(*x).diff(jabz.JzAzBz(*y)) for x, y in zip(a.tolist(), b.tolist())])
+    print('diff vs JzAzBz.diff:', np.abs(diff(a, b) - expected).max())
+    print('pairwiseDiff vs diff:', np.abs(pairwiseDiff(a, b) - diff(a[:, np.newaxis], b[np.newaxis])).max())
+
+    palette = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(m, 3)))
+    points = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(n, 3)))
+    t = timeit.default_timer()
+    index = PaletteIndex(palette)
+    print(f'index {m} colors: {timeit.default_timer() - t:.2f}s')
+    for k in (1, 4):
+        t = timeit.default_timer()
+        i, d = index.nearest(points, k)
+        t = timeit.default_timer() - t
+        bi, bd = bruteNearest(points[:500], palette, k)
+        assert np.allclose(d[:500], bd, rtol=0, atol=1e-15), k
+        print(f'nearest k={k}: {n/t/1e3:.0f} kqueries/s, agrees with brute force')
+
+    # Catalogs of many swatches in few distinct colors.
+    for distinct in (50, 5000):
+        colors = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(distinct, 3)))
+        palette = colors[rng.integers(0, distinct, size=m)]
+        t = timeit.default_timer()
+        index = PaletteIndex(palette)
+        i, d = index.nearest(points, 4)
+        t = timeit.default_timer() - t
+        bi, bd = bruteNearest(points[:500], palette, 4)
+        assert np.allclose(d[:500], bd, rtol=0, atol=1e-15), distinct
+        assert np.allclose(np.sqrt(np.sum((points[:, np.newaxis] - palette[i])**2, axis=-1)), d, rtol=0, atol=1e-15), distinct
+        print(f'{m} swatches in {distinct} colors: {int(np.prod(index.dims))} cells, index and {n} queries in {t:.2f}s, agrees with brute force')
+
+if __name__ == '__main__':
+    check()
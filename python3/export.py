@@ -0,0 +1,153 @@
+"""Bake Jch lookup textures and CSS palettes to files.
+
+jchTexture() evaluates a whole (height, width) grid of Jch colors at once; by
+default the same J x h plane at c = 0.2 that glsl/jchz.glsl draws, with J
+increasing up the image. The writers encode the full image or stylesheet in
+memory and hand it to the file in one write:
+
+    python3 export.py jchz.png --width 512 --height 512 --c 0.2
+    python3 export.py ramp.ff --width 1024 --height 1 --j 0.7 --c 0.3
+"""
+
+import io
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+import colorarray
+import farbfeld
+import gamut
+import jabznp
+
+
+def axis(value, n, flip=False):
+    """Texel-center coordinates in [0, 1] for an axis, or a constant."""
+    if isinstance(value, str):
+        t = (np.arange(n) + 0.5)/n
+        return t[::-1] if flip else t
+    return np.full(n, float(value))
+
+
+def jchTexture(width, height=1, j='y', c=0.2, h='x', mapping='clip'):
+    """(height, width, 4) RGBA1 texture of Jch colors.
+
+    Each of j, c and h is a constant or 'x'/'y' to run 0..1 across/up the
+    texture. mapping is 'clip' (clamp channels, as jabz.htmlrgb), 'mask'
+    (out-of-gamut texels become transparent) or 'gamut' (reduce chroma).
+    """
+    values = []
+    for v in (j, c, h):
+        if v == 'x':
+            values.append(np.broadcast_to(axis(v, width), (height, width)))
+        elif v == 'y':
+            values.append(np.broadcast_to(axis(v, height, flip=True)[:, np.newaxis], (height, width)))
+        else:
+            values.append(np.full((height, width), float(v)))
+    jch = np.stack(values, axis=-1)
+    rgba1 = np.ones((height, width, 4))
+    if mapping == 'gamut':
+        rgba1[..., :3] = gamut.jch_to_srgb_gamut_mapped(jch)
+    else:
+        srgb1 = jabznp.jch_to_srgb1(jch)
+        if mapping == 'mask':
+            rgba1[..., 3] = gamut.valid_srgb1(srgb1)
+        elif mapping != 'clip':
+            raise ValueError(f"unknown mapping {mapping!r}, expected 'clip', 'mask' or 'gamut'")
+        rgba1[..., :3] = np.clip(srgb1, 0, 1)
+    return rgba1
+
+
+def pngChunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def pngBytes(rgba1, bits=8):
+    """Encode an (H, W, 4) RGBA1 image as an 8- or 16-bit RGBA PNG."""
+    height, width = rgba1.shape[:2]
+    top = (1 << bits) - 1
+    pixels = np.rint(np.clip(rgba1, 0, 1)*top).astype('>u2' if bits == 16 else np.uint8)
+    rows = pixels.reshape(height, -1).view(np.uint8)
+    # Each scanline starts with its filter type; 0 is none.
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rows], axis=1)
+    header = struct.pack('>IIBBBBB', width, height, bits, 6, 0, 0, 0)
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        pngChunk(b'IHDR', header),
+        pngChunk(b'IDAT', zlib.compress(raw.tobytes(), 6)),
+        pngChunk(b'IEND', b''),
+    ])
+
+
+def farbfeldBytes(rgba1, mode='clip'):
+    height, width = rgba1.shape[:2]
+    return farbfeld.MAGIC + struct.pack('>II', width, height) + farbfeld.modes[mode](rgba1).tobytes()
+
+
+def npyBytes(array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    return buf.getvalue()
+
+
+encoders = {
+    '.png': pngBytes,
+    '.ff': farbfeldBytes,
+    '.npy': npyBytes,
+}
+
+
+def writeTexture(path, rgba1, format=None):
+    """Write an RGBA1 texture as PNG, farbfeld or .npy, chosen by format or the path's extension."""
+    format = format or os.path.splitext(path)[1].lower()
+    if format not in encoders:
+        raise ValueError(f'unknown texture format {format!r}, expected one of {sorted(encoders)}')
+    data = encoders[format](rgba1)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def cssStylesheet(colors, names=None, prefix='--jchz', selector=':root'):
+    """A stylesheet declaring one custom property per color.
+
+    colors is a ColorArray or a list of jabz.py colors of one class; names
+    defaults to the colors' indices.
+    """
+    if not isinstance(colors, colorarray.ColorArray):
+        colors = colorarray.ColorArray.fromColors(colors)
+    hexes = jabznp.htmlrgb(colors.srgb255().data)
+    names = range(len(hexes)) if names is None else names
+    lines = [f'{selector} {{']
+    lines += [f'  {prefix}-{name}: {color};' for name, color in zip(names, hexes)]
+    lines.append('}\n')
+    return '\n'.join(lines)
+
+
+def writeCss(path, colors, names=None, prefix='--jchz', selector=':root'):
+    data = cssStylesheet(colors, names, prefix, selector).encode()
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def main(argv):
+    import argparse
+
+    def value(s):
+        return s if s in ('x', 'y') else float(s)
+
+    parser = argparse.ArgumentParser(prog='export.py', description='Bake a Jch texture to PNG, farbfeld or .npy.')
+    parser.add_argument('output')
+    parser.add_argument('--width', type=int, default=256)
+    parser.add_argument('--height', type=int, default=256)
+    parser.add_argument('--j', type=value, default='y', help="J: a constant, or x/y to vary across/up (default: y)")
+    parser.add_argument('--c', type=value, default=0.2, help='c: as --j (default: 0.2)')
+    parser.add_argument('--h', type=value, default='x', help='h: as --j (default: x)')
+    parser.add_argument('--mapping', choices=('clip', 'mask', 'gamut'), default='clip')
+    args = parser.parse_args(argv)
+    writeTexture(args.output, jchTexture(args.width, args.height, args.j, args.c, args.h, args.mapping))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
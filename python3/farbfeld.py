@@ -0,0 +1,150 @@
+"""Streaming farbfeld I/O and the pixel-map tools from c++/ in NumPy.
+
+Images are read and written a block of rows at a time, so memory stays
+bounded by the block size however large the image is:
+
+    python3 farbfeld.py ff2jchz < in.ff > jchz.ff
+    python3 farbfeld.py jchz2ff --clip jchz.ff out.ff
+
+Output encoding matches c++/ff.cpp: each channel is truncated to an int after
+scaling by 0xFFFF, then either clipped to 0..0xFFFF (rgba1clip) or, if any
+channel is out of range, the pixel is replaced by transparent white
+(rgba1mask, the default, as in ff::mapCinCout).
+"""
+
+import struct
+import sys
+
+import numpy as np
+
+import gamut
+import jabznp
+
+
+MAGIC = b'farbfeld'
+
+BLOCK_PIXELS = 1 << 18
+
+FF16 = np.dtype('>u2')
+
+MASKED = np.array([0xFFFF, 0xFFFF, 0xFFFF, 0x0000], dtype=FF16)
+
+
+def readExactly(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError(f'truncated farbfeld data: expected {n} bytes, got {len(data)}')
+    return data
+
+
+def readHeader(f):
+    if readExactly(f, 8) != MAGIC:
+        raise ValueError('Not farbfeld file')
+    return struct.unpack('>II', readExactly(f, 8))
+
+
+def writeHeader(f, width, height):
+    f.write(MAGIC + struct.pack('>II', width, height))
+
+
+def blockRows(width, pixels=BLOCK_PIXELS):
+    return max(1, pixels//max(1, width))
+
+
+def readBlocks(f, width, height, rows=None):
+    """Yield (rows, width, 4) float64 RGBA1 blocks covering the image top to bottom."""
+    rows = rows or blockRows(width)
+    for y in range(0, height, rows):
+        n = min(rows, height - y)
+        data = readExactly(f, n*width*8)
+        yield np.frombuffer(data, dtype=FF16).reshape(n, width, 4)/0xFFFF
+
+
+def rgba1clip(rgba1):
+    with np.errstate(invalid='ignore'):
+        x = np.nan_to_num(np.trunc(np.asarray(rgba1)*0xFFFF), nan=0)
+    return np.clip(x, 0, 0xFFFF).astype(FF16)
+
+
+def rgba1mask(rgba1):
+    with np.errstate(invalid='ignore'):
+        x = np.trunc(np.asarray(rgba1)*0xFFFF)
+        bad = ~np.all((x >= 0) & (x <= 0xFFFF), axis=-1)
+    out = np.where(bad[..., np.newaxis], 0, x).astype(FF16)
+    out[bad] = MASKED
+    return out
+
+
+modes = {
+    'mask': rgba1mask,
+    'clip': rgba1clip,
+}
+
+
+def withAlpha(convert):
+    def map(rgba1):
+        out = np.empty_like(rgba1)
+        out[..., :3] = convert(rgba1[..., :3])
+        out[..., 3] = rgba1[..., 3]
+        return out
+    return map
+
+
+maps = {
+    'ff2jabz': withAlpha(lambda srgb1: jabznp.srgb255_to_jabz(srgb1*255)),
+    'ff2jchz': withAlpha(lambda srgb1: jabznp.srgb255_to_jch(srgb1*255)),
+    'jabz2ff': withAlpha(lambda jabz: jabznp.jabz_to_srgb255(jabz)/255),
+    'jchz2ff': withAlpha(jabznp.jch_to_srgb1),
+    'jchz2ff-approx': withAlpha(gamut.jch_to_srgb_gamut_mapped),
+}
+
+
+def mapStream(src, dst, map, mode='mask', rows=None):
+    """Read farbfeld from src, apply map to each RGBA1 block and write farbfeld to dst."""
+    encode = modes[mode]
+    width, height = readHeader(src)
+    writeHeader(dst, width, height)
+    for block in readBlocks(src, width, height, rows):
+        dst.write(encode(map(block)).tobytes())
+    dst.flush()
+
+
+def read(f):
+    """Read a whole image as an (height, width, 4) RGBA1 array."""
+    width, height = readHeader(f)
+    return np.concatenate(list(readBlocks(f, width, height)) or [np.empty((0, width, 4))])
+
+
+def write(f, rgba1, mode='mask'):
+    height, width = rgba1.shape[:2]
+    writeHeader(f, width, height)
+    encode = modes[mode]
+    rows = blockRows(width)
+    for y in range(0, height, rows):
+        f.write(encode(rgba1[y:y + rows]).tobytes())
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='farbfeld.py', description='Map farbfeld pixels between sRGB and jabz/jchz.')
+    parser.add_argument('map', choices=sorted(maps))
+    parser.add_argument('--clip', dest='mode', action='store_const', const='clip', default='mask', help='clamp out-of-range channels instead of masking the pixel')
+    parser.add_argument('--rows', type=int, help='rows per block (default: about %d pixels per block)' % BLOCK_PIXELS)
+    parser.add_argument('input', nargs='?', help='input file (default: stdin)')
+    parser.add_argument('output', nargs='?', help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    src = open(args.input, 'rb') if args.input else sys.stdin.buffer
+    dst = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        mapStream(src, dst, maps[args.map], args.mode, args.rows)
+    finally:
+        if args.input:
+            src.close()
+        if args.output:
+            dst.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
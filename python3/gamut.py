@@ -0,0 +1,95 @@
+"""Gamut mapping for Jch -> sRGB by chroma reduction, over whole NumPy arrays.
+
+This is the array version of jchzToSrgb in c++/jchz2ff-approx.cpp: colors
+outside sRGB keep their lightness and hue and have their chroma bisected down
+to the gamut boundary, rather than being clamped per channel (which shifts
+hue, as htmlrgb does).
+"""
+
+import numpy as np
+
+import cusp
+import jabznp
+from cusp import valid_srgb1, bisectChroma
+
+
+def tableChroma(table, jch, probes=8, tolerance=1/128):
+    """(chroma, sRGB1) as bisectChroma finds them, bisecting only within tolerance of the table's chroma.
+
+    The bracket is not probed up front. Lanes that come back out of gamut, or
+    that end at the top of a bracket whose top is in gamut, were further from
+    the table than tolerance and are bisected again on the side the boundary
+    turned out to be.
+    """
+    j, c, h = jabznp.components(jch)
+    guess = table.maxChroma(j, h)
+    low = np.clip(guess - tolerance, 0, c)
+    high = np.clip(guess + tolerance, 0, c)
+    low = bisectChroma(jch, probes, tolerance, low, high)
+    srgb1 = jabznp.jch_to_srgb1(jabznp.stack(j, low, h))
+    ok = valid_srgb1(srgb1)
+    top = np.flatnonzero(ok & (high < c) & (high - low <= tolerance))
+    above = np.zeros_like(ok)
+    above[top] = valid_srgb1(jabznp.jch_to_srgb1(jabznp.stack(j[top], high[top], h[top])))
+
+    redo = np.flatnonzero(~ok | above)
+    if redo.size:
+        low[redo] = bisectChroma(jch[redo], probes, tolerance, np.where(above[redo], high[redo], 0), np.where(above[redo], c[redo], low[redo]))
+        srgb1[redo] = jabznp.jch_to_srgb1(jabznp.stack(j[redo], low[redo], h[redo]))
+    return low, srgb1
+
+
+def jch_to_srgb_gamut_mapped(jch, probes=8, tolerance=1/128, table=None):
+    """Convert (..., 3) Jch to sRGB1, reducing the chroma of out-of-gamut colors.
+
+    probes and tolerance bound the bisection as in the C++ tool. With a
+    cusp.CuspTable, each out-of-gamut color bisects a bracket of tolerance
+    either side of the table's chroma instead of [0, c] (see tableChroma).
+    Colors whose chroma reaches zero become the grey (j, j, j), as in the C++
+    tool.
+    """
+    jch = np.asarray(jch, dtype=np.float64)
+    shape = jch.shape
+    jch = jch.reshape(-1, 3)
+    srgb1 = jabznp.jch_to_srgb1(jch)
+    out = np.flatnonzero(~valid_srgb1(srgb1))
+    if out.size == 0:
+        return srgb1.reshape(shape)
+
+    target = jch[out]
+    j, c, h = jabznp.components(target)
+    if table is None:
+        low = bisectChroma(target, probes, tolerance)
+        mapped = jabznp.jch_to_srgb1(jabznp.stack(j, low, h))
+    else:
+        low, mapped = tableChroma(table, target, probes, tolerance)
+    grey = low == 0
+    mapped[grey] = j[grey, np.newaxis]
+    srgb1[out] = mapped
+    return srgb1.reshape(shape)
+
+
+def check(n=200000, seed=0):
+    import timeit
+
+    rng = np.random.default_rng(seed)
+    jch = rng.random((n, 3))
+    srgb1 = jch_to_srgb_gamut_mapped(jch)
+    inGamut = valid_srgb1(srgb1)
+    print(f'{inGamut.mean()*100:.2f}% of mapped colors in gamut')
+
+    table = cusp.table()
+    assert valid_srgb1(jch_to_srgb_gamut_mapped(jch, table=table)).all()
+    reference = jch_to_srgb_gamut_mapped(jch, probes=60, tolerance=0)
+    cases = [('bisection', lambda: jch_to_srgb_gamut_mapped(jch)), ('cusp + bisection', lambda: jch_to_srgb_gamut_mapped(jch, table=table))]
+    times = []
+    for name, f in cases:
+        error = np.abs(f() - reference).max()
+        times.append(min(timeit.repeat(f, number=1, repeat=3)))
+        print(f'{name:18} {n/times[-1]/1e6:6.2f} Mpixel/s, max sRGB1 difference from converged {error:.4f}')
+    # The table bracket leaves about 2 probes per color instead of about 7.
+    assert times[0]/times[1] > 1.3, f'cusp table speedup {times[0]/times[1]:.2f}x'
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,143 @@
+"""Perceptual gradients: control points in any color space, sampled in one pass.
+
+    g = Gradient([jabz.Jch(0.2, 0.5, 0.7), jabz.Jch(0.9, 0.4, 0.15)])
+    g.hex(9)                    # ['#...', ...] as jabz.jchz() would give
+    g.rgba(4096)                # (4096, 4) uint8 texture
+
+Control points are jabz.py NamedTuples (or an array plus a space name) and are
+interpolated in Jch by default, where the hue takes the shorter way round the
+circle; interpolate='jabz' or 'jzazbz' gives straight lines instead. Sampled
+tables are memoized per gradient and stop count.
+"""
+
+import functools
+
+import numpy as np
+
+import colorarray
+import gamut
+import jabznp
+
+
+class Gradient:
+    __slots__ = ('points', 'positions', 'interpolate', 'mapping')
+
+    def __init__(self, points, positions=None, space=None, interpolate='jch', mapping='clip'):
+        """points: jabz.py colors of one class, or an (N, 3) array with space naming its color space.
+
+        positions: where each control point sits in [0, 1], evenly spaced by default.
+        mapping: 'clip' clamps sRGB channels like jabz.htmlrgb; 'gamut' reduces
+        chroma instead (gamut.jch_to_srgb_gamut_mapped).
+        """
+        colors = colorarray.ColorArray(points, space) if space else colorarray.ColorArray.fromColors(points)
+        if colors.data.ndim != 2 or len(colors) < 1:
+            raise ValueError('a gradient needs an (N, 3) array of at least one control point')
+        if mapping not in ('clip', 'gamut'):
+            raise ValueError(f"unknown mapping {mapping!r}, expected 'clip' or 'gamut'")
+        if positions is None:
+            positions = np.linspace(0, 1, len(colors)) if len(colors) > 1 else np.zeros(1)
+        positions = np.asarray(positions, dtype=np.float64)
+        if positions.shape != (len(colors),) or np.any(np.diff(positions) < 0):
+            raise ValueError('positions must be one non-decreasing value per control point')
+        self.points = tuple(map(tuple, colors.convert(interpolate).data.tolist()))
+        self.positions = tuple(positions.tolist())
+        self.interpolate = interpolate
+        self.mapping = mapping
+
+    def key(self):
+        return (self.points, self.positions, self.interpolate, self.mapping)
+
+    def __eq__(self, other):
+        return isinstance(other, Gradient) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f'Gradient({self.points!r}, positions={self.positions!r}, interpolate={self.interpolate!r})'
+
+    def samples(self, n):
+        """(n, 3) colors in the interpolation space at n evenly spaced stops."""
+        return sampleTable(*self.key(), n)[0]
+
+    def srgb255(self, n):
+        """(n, 3) float sRGB255 at n evenly spaced stops (read-only, shared by the cache)."""
+        return sampleTable(*self.key(), n)[1]
+
+    def rgba(self, n, alpha=1):
+        """(n, 4) uint8 RGBA texture."""
+        out = np.empty((n, 4), dtype=np.uint8)
+        out[:, :3] = np.rint(np.clip(self.srgb255(n), 0, 255))
+        out[:, 3] = round(255*max(0, min(1, alpha)))
+        return out
+
+    def hex(self, n, alpha=1):
+        """n color strings formatted as jabz.htmlrgb does."""
+        return hexTable(*self.key(), n, alpha)
+
+
+def unwrapHue(points):
+    """Jch control points with h unwrapped so each step takes the shorter way round.
+
+    Grey points (c == 0) have no hue of their own and borrow their nearest
+    chromatic neighbor's, so a fade to grey does not swing through other hues.
+    """
+    j, c, h = points.T.copy()
+    chromatic = np.flatnonzero(c > 0)
+    if chromatic.size:
+        nearest = chromatic[np.abs(np.arange(len(h))[:, np.newaxis] - chromatic[np.newaxis, :]).argmin(axis=1)]
+        h = h[nearest]
+    steps = (np.diff(h) + 0.5) % 1 - 0.5
+    h = h[0] + np.concatenate([[0], np.cumsum(steps)])
+    return np.stack([j, c, h], axis=-1)
+
+
+@functools.lru_cache(maxsize=256)
+def sampleTable(points, positions, interpolate, mapping, n):
+    points = np.array(points)
+    if interpolate == 'jch':
+        points = unwrapHue(points)
+    t = np.linspace(0, 1, n)
+    samples = np.stack([np.interp(t, positions, points[:, i]) for i in range(3)], axis=-1)
+    if interpolate == 'jch':
+        samples[:, 2] %= 1
+    colors = colorarray.ColorArray(samples, interpolate)
+    if mapping == 'gamut':
+        srgb255 = gamut.jch_to_srgb_gamut_mapped(colors.jch().data)*255
+    else:
+        srgb255 = colors.srgb255().data
+    for table in (samples, srgb255):
+        table.flags.writeable = False
+    return samples, srgb255
+
+
+@functools.lru_cache(maxsize=256)
+def hexTable(points, positions, interpolate, mapping, n, alpha):
+    return tuple(jabznp.htmlrgb(sampleTable(points, positions, interpolate, mapping, n)[1], alpha))
+
+
+def check():
+    import timeit
+
+    import jabz
+
+    stops = [jabz.Jch(0.2, 0.5, 0.7), jabz.Jch(0.6, 0.6, 0.95), jabz.Jch(0.9, 0.4, 0.15)]
+    g = Gradient(stops)
+    expected = [jabz.jchz(*s) for s in stops]
+    print('ends and middle match jabz.jchz:', list(g.hex(3)) == expected)
+    # 0.95 -> 0.15 should wrap through 0, not go back down through 0.5.
+    print('hues:', np.round(g.samples(9)[:, 2], 3).tolist())
+
+    n = 4096
+    sampleTable.cache_clear()
+    hexTable.cache_clear()
+    t = timeit.default_timer()
+    g.hex(n)
+    cold = timeit.default_timer() - t
+    t = timeit.timeit(lambda: g.hex(n), number=100)/100
+    scalar = timeit.timeit(lambda: [jabz.jchz(0.2, 0.5, i/1000) for i in range(1000)], number=1)*n/1000
+    print(f'{n} stops: {cold*1e3:.1f}ms cold, {t*1e6:.1f}us cached, per-stop jchz() {scalar*1e3:.0f}ms')
+
+
+if __name__ == '__main__':
+    check()
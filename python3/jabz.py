@@ -1,6 +1,8 @@
 import typing
 import math
 import hashlib
+import collections
+import threading
 
 from affine import A2
 
@@ -16,8 +18,55 @@ def jchz(j, c, h, alpha=1):
 
 
 def jchzHash(j, c, st, alpha=1):
-    h = hashlib.shake_128(st.encode()).digest(1)
-    return jchz(j, c, h[0]/255, alpha)
+    return jchzPalettes(j, c, st, alpha)
+
+
+class JchzPalettes:
+    """LRU cache of the 256 jchz colors a hash byte can pick for each (j, c, alpha).
+
+    Calling it gives the same string as jchz(j, c, h[0]/255, alpha) for the
+    shake_128 byte h[0] of st, but only the first call for a (j, c, alpha)
+    pays for the conversions.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.palettes = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def palette(self, j, c, alpha=1):
+        key = (j, c, alpha)
+        with self.lock:
+            p = self.palettes.get(key)
+            if p is not None:
+                self.hits += 1
+                self.palettes.move_to_end(key)
+                return p
+            self.misses += 1
+        p = tuple(jchz(j, c, i/255, alpha) for i in range(256))
+        with self.lock:
+            self.palettes[key] = p
+            while len(self.palettes) > self.size:
+                self.palettes.popitem(last=False)
+        return p
+
+    def __call__(self, j, c, st, alpha=1):
+        h = hashlib.shake_128(st.encode()).digest(1)
+        return self.palette(j, c, alpha)[h[0]]
+
+    def clear(self):
+        with self.lock:
+            self.palettes.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': self.size, 'palettes': len(self.palettes)}
+
+
+jchzPalettes = JchzPalettes()
 
 
 def htmlrgb(r, g, b, alpha=1):
@@ -87,7 +136,7 @@ class SRGB255(typing.NamedTuple):
         return self.srgb1().rgb1().xyz1().xyz100().jzazbz().jzczhz().jch()
 
     def jabz(self):
-        return self.srgb1().rgb1().xyz1().xyz100().jzazbz().jzczhz().jabz()
+        return self.srgb1().rgb1().xyz1().xyz100().jzazbz().jabz()
 
 class SRGB1(typing.NamedTuple):
     r : C_SRGB1
@@ -190,6 +239,14 @@ JzAzBz_az_offset = float.fromhex('-0x1.d70940803ec74p-2')
 JzAzBz_bz_scale = float.fromhex('0x1.d75c195cc2180p+1')
 JzAzBz_bz_offset = float.fromhex('-0x1.26bc2f723fda1p-1')
 
+# jabzfast.py is generated by srgb255ToJzAzBz.py, which imports this module,
+# so it is imported on first use rather than with the module.
+jabzfast = None
+
+def importJabzfast():
+    global jabzfast
+    import jabzfast
+
 class JzAzBz(typing.NamedTuple):
     jz : float
     az : float
@@ -202,6 +259,12 @@ class JzAzBz(typing.NamedTuple):
         H = 2 * math.sqrt(c1*c2) * math.sin(h/2)
         return math.sqrt((self.jz - other.jz)**2 + (c1-c2)**2 + H**2)
 
+    def chroma(self):
+        return math.hypot(self.az, self.bz)
+
+    def hue(self):
+        return math.atan2(self.bz, self.az)
+
     def xyz100(self):
         jz = self.jz
         az = self.az
@@ -221,7 +284,7 @@ class JzAzBz(typing.NamedTuple):
             if x < 0:
                 return 0
             y = x**(1/p)
-            return 10000*((c1 - y)/(c3*y - c2))**(1/n)
+            return 10000*max(0, (c1 - y)/(c3*y - c2))**(1/n)
         
         iz = (jz + d0) / (1 + d - d*(jz + d0))
 
@@ -233,21 +296,20 @@ class JzAzBz(typing.NamedTuple):
         m = f(m_)
         s = f(s_)
 
-        try:
-            x_ = math.fsum([float.fromhex('0x1.ec9a1a8bce714p+0')*l, float.fromhex('-0x1.013a11a9de8acp+0')*m, float.fromhex('0x1.3470b79eb8366p-5')*s])
-            y_ = math.fsum([float.fromhex('0x1.66b96ff1c1292p-2')*l, float.fromhex('0x1.73f557d230e47p-1')*m, float.fromhex('-0x1.0bd08963ad7e9p-4')*s])
-            z_ = math.fsum([float.fromhex('-0x1.74aa645ab6306p-4')*l, float.fromhex('-0x1.403bd8515285fp-2')*m, float.fromhex('0x1.85d407843f9bep+0')*s])
-        except TypeError:
-            print(s, s_, file=sys.stderr)
-            x_ = 0
-            y_ = 0
-            z_ = 0
+        x_ = math.fsum([float.fromhex('0x1.ec9a1a8bce714p+0')*l, float.fromhex('-0x1.013a11a9de8acp+0')*m, float.fromhex('0x1.3470b79eb8366p-5')*s])
+        y_ = math.fsum([float.fromhex('0x1.66b96ff1c1292p-2')*l, float.fromhex('0x1.73f557d230e47p-1')*m, float.fromhex('-0x1.0bd08963ad7e9p-4')*s])
+        z_ = math.fsum([float.fromhex('-0x1.74aa645ab6306p-4')*l, float.fromhex('-0x1.403bd8515285fp-2')*m, float.fromhex('0x1.85d407843f9bep+0')*s])
         
         z = z_
         x = (x_ + (b-1)*z)/b
         y = (y_ + (g-1)*x)/g
         return XYZ100(x, y, z)
 
+    def srgb255(self):
+        if jabzfast is None:
+            importJabzfast()
+        return SRGB255(*jabzfast.jzazbzToSrgb255(self.jz, self.az, self.bz))
+
     def jabz(self):
         return Jabz(
             jz2j(self.jz),
@@ -271,7 +333,7 @@ class Jabz(typing.NamedTuple):
         )
 
     def srgb255(self):
-        return self.jzazbz().xyz100().xyz1().rgb1().srgb1().srgb255()
+        return self.jzazbz().srgb255()
 
 def jabz2srgb(j, a, b):
     return Jabz(j, a, b).srgb255()
@@ -291,7 +353,7 @@ class JzCzhz(typing.NamedTuple):
         return JzAzBz(self.jz, self.cz * math.cos(self.hz), self.cz * math.sin(self.hz))
 
     def srgb255(self):
-        return self.jzazbz().xyz100().xyz1().rgb1().srgb1().srgb255()
+        return self.jzazbz().srgb255()
 
     def jch(self):
         return Jch(self.jz/JzCzHz_jz1, self.cz/JzCzHz_cz1, 0.5 + self.hz/math.tau)
@@ -305,10 +367,10 @@ class Jch(typing.NamedTuple):
         return JzCzhz(self.j*JzCzHz_jz1, self.c*JzCzHz_cz1, (self.h - 0.5)*math.tau)
 
     def srgb1(self):
-        return self.jzczhz().jzazbz().xyz100().xyz1().rgb1().srgb1()
+        return self.srgb255().srgb1()
 
     def srgb255(self):
-        return self.jzczhz().jzazbz().xyz100().xyz1().rgb1().srgb1().srgb255()
+        return self.jzczhz().jzazbz().srgb255()
 
 def srgb2jch(r, g, b):
     return SRGB255(r, g, b).jzczhz()
@@ -316,6 +378,71 @@ def srgb2jch(r, g, b):
 def jch2srgb(j, c, h):
     return Jch(j, c, h).srgb255()
 
+class Color:
+    """One color that converts to each space on demand and keeps every result.
+
+    Conversions follow colorarray.route from the original space, starting
+    from the last space on the way that is already computed, so after jch()
+    the calls jzazbz() and jabz() cost at most one step each. The values are
+    the ones the methods of the wrapped class give.
+    """
+    __slots__ = ('origin', '_srgb255', '_srgb1', '_rgb1', '_xyz1', '_xyz100', '_jzazbz', '_jzczhz', '_jch', '_jabz')
+
+    # (origin, space): the colorarray.route steps between them.
+    routes = {}
+
+    def __init__(self, color):
+        # colorarray imports this module, so it is only imported once both exist.
+        import colorarray
+        origin = colorarray.spaces.get(type(color))
+        if origin is None:
+            raise TypeError(f'expected a color of one of {[c.__name__ for c in colorarray.spaces]}, got {type(color).__name__}')
+        self.origin = origin
+        setattr(self, '_' + origin, color)
+
+    def value(self, space):
+        v = getattr(self, '_' + space, None)
+        if v is None:
+            steps = self.routes.get((self.origin, space))
+            if steps is None:
+                import colorarray
+                steps = self.routes[self.origin, space] = colorarray.route(self.origin, space)
+            for a, b in steps:
+                if getattr(self, '_' + b, None) is None:
+                    setattr(self, '_' + b, getattr(getattr(self, '_' + a), b)())
+            v = getattr(self, '_' + space)
+        return v
+
+    def srgb255(self):
+        return self.value('srgb255')
+
+    def srgb1(self):
+        return self.value('srgb1')
+
+    def rgb1(self):
+        return self.value('rgb1')
+
+    def xyz1(self):
+        return self.value('xyz1')
+
+    def xyz100(self):
+        return self.value('xyz100')
+
+    def jzazbz(self):
+        return self.value('jzazbz')
+
+    def jzczhz(self):
+        return self.value('jzczhz')
+
+    def jch(self):
+        return self.value('jch')
+
+    def jabz(self):
+        return self.value('jabz')
+
+    def __repr__(self):
+        return f'Color({getattr(self, "_" + self.origin)!r})'
+
 def findJchBounds():
     import itertools
     import random
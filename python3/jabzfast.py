@@ -0,0 +1,51 @@
+# Generated by srgb255ToJzAzBz.py from the folded jabz.py conversion; do not edit.
+
+
+def srgb255ToJzAzBz(sr, sg, sb):
+    r = (sr*0.0003035269835488374917 if sr <= 10.31475 else (sr*0.003717126661090976675 + 0.05213270142180094787)**2.4)
+    g = (sg*0.0003035269835488374917 if sg <= 10.31475 else (sg*0.003717126661090976675 + 0.05213270142180094787)**2.4)
+    b = (sb*0.0003035269835488374917 if sb <= 10.31475 else (sb*0.003717126661090976675 + 0.05213270142180094787)**2.4)
+    l2 = (r*0.003585083359727932572 + g*0.005092044060011000719 + b*0.001041169201586239260)**0.15930175781250
+    l_ = ((l2*18.8515625 + 0.835937500000)/(l2*18.6875000 + 1))**134.034375
+    m2 = (r*0.002204179837045521148 + g*0.005922988107728221186 + b*0.001595495732321790141)**0.15930175781250
+    m_ = ((m2*18.8515625 + 0.835937500000)/(m2*18.6875000 + 1))**134.034375
+    iz = l_*0.5 + m_*0.5
+    jz = iz*0.44/(iz*-0.56 + 1) + -1.6295499532821566e-11
+    s2 = (r*0.0007936150919572405067 + g*0.002303422557560143382 + b*0.006631801538878254703)**0.15930175781250
+    s_ = ((s2*18.8515625 + 0.835937500000)/(s2*18.6875000 + 1))**134.034375
+    az = l_*3.524000 + m_*-4.066708 + s_*0.542708
+    bz = l_*0.199076 + m_*1.096799 + s_*-1.295875
+    return jz, az, bz
+
+
+def jzazbzToXyz100(jz, az, bz):
+    iz0 = jz + 1.6295499532821566e-11
+    iz = iz0/(iz0*0.56 + 0.44)
+    l1 = max(iz + az*0.1386050432715393022 + bz*0.05804731615611882778, 0)**0.007460772656268214777
+    l5 = max((l1*-1 + 0.835937500000)/(l1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    m1 = max(iz + az*-0.1386050432715392744 + bz*-0.05804731615611890411, 0)**0.007460772656268214777
+    m5 = max((m1*-1 + 0.835937500000)/(m1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    s1 = max(iz + az*-0.09601924202631895167 + bz*-0.8118918960560389531, 0)**0.007460772656268214777
+    s5 = max((s1*-1 + 0.835937500000)/(s1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    x = l5*16613.73055774069350 + m5*-9145.230923250667863 + s5*2313.620767186148209
+    y = l5*-3250.758740427038049 + m5*15718.47038366936257 + s5*-2182.538318672940151
+    z = l5*-909.8281098284752288 + m5*-3127.282905230738819 + s5*15227.66561305260336
+    return x, y, z
+
+
+def jzazbzToSrgb255(jz, az, bz):
+    iz0 = jz + 1.6295499532821566e-11
+    iz = iz0/(iz0*0.56 + 0.44)
+    l1 = max(iz + az*0.1386050432715393022 + bz*0.05804731615611882778, 0)**0.007460772656268214777
+    l5 = max((l1*-1 + 0.835937500000)/(l1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    m1 = max(iz + az*-0.1386050432715392744 + bz*-0.05804731615611890411, 0)**0.007460772656268214777
+    m5 = max((m1*-1 + 0.835937500000)/(m1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    s1 = max(iz + az*-0.09601924202631895167 + bz*-0.8118918960560389531, 0)**0.007460772656268214777
+    s5 = max((s1*-1 + 0.835937500000)/(s1*18.6875000 + -18.8515625), 0)**6.277394636015325670
+    r1 = l5*592.8963755404249891 + m5*-522.3947425797513470 + s5*32.59644233339026778
+    r = (r1*3294.60 if r1 <= 0.003130804953560371341 else max(r1, 0.003130804953560371341)**0.4166666666666666667*269.025 + -14.025)
+    g1 = l5*-222.3295790445721752 + m5*382.1527473694614592 + s5*-57.03433147128811548
+    g = (g1*3294.60 if g1 <= 0.003130804953560371341 else max(g1, 0.003130804953560371341)**0.4166666666666666667*269.025 + -14.025)
+    b1 = l5*6.270913830078805615 + m5*-70.21906556220011906 + s5*166.6975603243740906
+    b = (b1*3294.60 if b1 <= 0.003130804953560371341 else max(b1, 0.003130804953560371341)**0.4166666666666666667*269.025 + -14.025)
+    return r, g, b
@@ -0,0 +1,142 @@
+"""Precomputed SRGB255 -> JzAzBz table for all 2**24 integer colors.
+
+The table is a (256, 256, 256, 3) float32 .npy file opened with numpy.memmap,
+so every process converting pixels shares the same pages through the page
+cache. Its file name carries VERSION and a fingerprint of the conversion
+constants, so a stale table is never picked up after the math changes. The
+cache helpers here also serve cusp.py's tables.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import jabznp
+
+
+VERSION = 2
+
+SHAPE = (256, 256, 256, 3)
+
+
+def fingerprint():
+    """Hash of every constant of the sRGB <-> JzAzBz <-> Jch conversions, both ways.
+
+    The sRGB curve's constants are literals in jabznp, so the curve is hashed
+    by its values at a few points.
+    """
+    h = hashlib.sha256()
+    for mat in (jabznp.RGB1_XYZ1, jabznp.XYZ1_RGB1, jabznp.XYZ_LMS, jabznp.LMS_XYZ, jabznp.LMS_IAB, jabznp.IAB_LMS):
+        h.update(mat.tobytes())
+    consts = (jabznp.pq_b, jabznp.pq_g, jabznp.pq_c1, jabznp.pq_c2, jabznp.pq_c3, jabznp.pq_n, jabznp.pq_p, jabznp.pq_d, jabznp.pq_d0,
+        jabznp.SRGB_CUT, jabznp.JzCzHz_jz1, jabznp.JzCzHz_cz1)
+    h.update(np.array(consts).tobytes())
+    x = np.linspace(0, 1, 17)
+    h.update(jabznp.srgb1_to_rgb1(x).tobytes())
+    h.update(jabznp.rgb1_to_srgb1(x).tobytes())
+    return h.hexdigest()[:12]
+
+
+def cacheDir():
+    return os.environ.get('JABZ_LUT_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'jabz')
+
+
+def cachePath(name):
+    """Path in cacheDir() for a table called name, tagged with fingerprint()."""
+    return os.path.join(cacheDir(), f'{name}-{fingerprint()}.npy')
+
+
+def writeAtomically(path, write):
+    """Call write(tmp) on a temporary file beside path, then move it into place."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return path
+
+
+def loadCached(path, build=None, mmap_mode=None):
+    """np.load path, first calling build(path) if it is missing and build is given."""
+    if not os.path.exists(path):
+        if build is None:
+            raise FileNotFoundError(path)
+        build(path)
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def defaultPath():
+    return cachePath(f'srgb255-jzazbz-v{VERSION}')
+
+
+def writeLut(path):
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=SHAPE)
+    g, b = np.meshgrid(np.arange(256), np.arange(256), indexing='ij')
+    for r in range(256):
+        plane = np.stack([np.full_like(g, r), g, b], axis=-1)
+        table[r] = jabznp.srgb255_to_jzazbz(plane)
+    table.flush()
+
+
+def buildLut(path=None):
+    """Compute the table one red plane at a time and atomically move it into place."""
+    return writeAtomically(path or defaultPath(), writeLut)
+
+
+def openLut(path=None, build=True):
+    path = path or defaultPath()
+    table = loadCached(path, buildLut if build else None, mmap_mode='r')
+    if table.shape != SHAPE or table.dtype != np.float32:
+        raise ValueError(f'{path}: expected a float32 table of shape {SHAPE}, got {table.dtype} {table.shape}')
+    return table
+
+
+_table = None
+
+def lut():
+    """The default table, opened (and built if missing) on first use."""
+    global _table
+    if _table is None:
+        _table = openLut()
+    return _table
+
+
+def srgb255_to_jzazbz(arr, table=None):
+    """Look up integer (..., 3) sRGB pixels; a single gather, no PQ math."""
+    arr = np.asarray(arr)
+    if arr.ndim < 1 or arr.shape[-1] != 3:
+        raise ValueError(f'expected an array of shape (..., 3), got {arr.shape}')
+    if not np.issubdtype(arr.dtype, np.integer):
+        raise TypeError(f'expected integer pixels, got {arr.dtype}')
+    if arr.size and (arr.min() < 0 or arr.max() > 255):
+        raise ValueError('pixel values must be in 0..255')
+    if table is None:
+        table = lut()
+    index = (arr[..., 0].astype(np.intp) << 16) | (arr[..., 1].astype(np.intp) << 8) | arr[..., 2]
+    return np.take(table.reshape(-1, 3), index, axis=0)
+
+
+def check(n=100000, seed=0):
+    import jabz
+
+    rng = np.random.default_rng(seed)
+    srgb = rng.integers(0, 256, size=(n, 3))
+    expected = np.array([jabz.SRGB255(*c).jzazbz() for c in srgb[:1000].tolist()])
+    actual = srgb255_to_jzazbz(srgb[:1000])
+    print('max abs error vs SRGB255.jzazbz():', np.abs(actual - expected).max())
+
+    import timeit
+    t = timeit.timeit(lambda: srgb255_to_jzazbz(srgb), number=10)/10
+    print(f'lookup: {n/t/1e6:.1f} Mpixel/s')
+
+
+if __name__ == '__main__':
+    print(defaultPath())
+    check()
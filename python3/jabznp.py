@@ -0,0 +1,491 @@
+"""NumPy batch counterparts of the jabz.py conversion chain.
+
+Every function takes an array whose last axis holds the three components of a
+color, e.g. (N, 3) palettes or (H, W, 3) images, and returns a float64 array of
+the same shape. The conversions run as whole-array expressions.
+
+Results agree with the scalar jabz.py classes to within ULP_TOLERANCE units in
+the last place of the top of the output space's range (255 for sRGB, 1 for Jch,
+JzCzHz_jz1 for JzAzBz). The scalar classes use math.fsum for every dot product
+and these use plain float sums; the PQ exponent of ~134 turns those one-ulp
+differences in the LMS sums into a few thousand ulps in the result.
+
+The sRGB255 <-> JzAzBz conversions also take accuracy='fast': folded
+single-precision kernels, within DELTA_E_BOUND of the exact results. With
+accuracy='lut', integer sRGB255 pixels are read from the jabzlut table and
+everything else runs exact; for jzazbz_to_srgb255, 'lut' is an alias of
+'exact'. The PQ curves alone take all three tiers, 'lut'
+being piecewise-linear tables.
+"""
+
+import hashlib
+import itertools
+import math
+
+import numpy as np
+
+import jabz
+import jabzfastnp
+from jabz import JzCzHz_jz1, JzCzHz_cz1, jz2j, az2a, bz2b, j2jz, a2az, b2bz
+
+
+ULP_TOLERANCE = 8192
+
+RGB1_XYZ1 = np.array([
+    [float.fromhex('0x1.a64c2f52ea72dp-2'), float.fromhex('0x1.6e2eb1f1be0c8p-2'), float.fromhex('0x1.71a9fdd4910cdp-3')],
+    [float.fromhex('0x1.b3679fbabb7e3p-3'), float.fromhex('0x1.6e2eb13cc6544p-1'), float.fromhex('0x1.27bb34179021ap-4')],
+    [float.fromhex('0x1.3c362381906d4p-6'), float.fromhex('0x1.e83e4d9c14333p-4'), float.fromhex('0x1.e6a7f1325153ep-1')],
+])
+
+XYZ1_RGB1 = np.array([
+    [3.2406255, -1.537208, -0.4986286],
+    [-0.9689307, 1.8757561, 0.0415175],
+    [0.0557101, -0.2040211, 1.0569959],
+])
+
+XYZ_LMS = np.array([
+    [0.41478972, 0.579999, 0.0146480],
+    [-0.2015100, 1.120649, 0.0531008],
+    [-0.0166008, 0.264800, 0.6684799],
+])
+
+LMS_IAB = np.array([
+    [0.5, 0.5, 0],
+    [3.524000, -4.066708, 0.542708],
+    [0.199076, 1.096799, -1.295875],
+])
+
+IAB_LMS = np.array([
+    [1, float.fromhex('0x1.1bdcf5ff4b9ffp-3'), float.fromhex('0x1.db860b905af44p-5')],
+    [1, float.fromhex('-0x1.1bdcf5ff4b9fep-3'), float.fromhex('-0x1.db860b905af4fp-5')],
+    [1, float.fromhex('-0x1.894b7904a2cf8p-4'), float.fromhex('-0x1.9fb04b6ae56fdp-1')],
+])
+
+LMS_XYZ = np.array([
+    [float.fromhex('0x1.ec9a1a8bce714p+0'), float.fromhex('-0x1.013a11a9de8acp+0'), float.fromhex('0x1.3470b79eb8366p-5')],
+    [float.fromhex('0x1.66b96ff1c1292p-2'), float.fromhex('0x1.73f557d230e47p-1'), float.fromhex('-0x1.0bd08963ad7e9p-4')],
+    [float.fromhex('-0x1.74aa645ab6306p-4'), float.fromhex('-0x1.403bd8515285fp-2'), float.fromhex('0x1.85d407843f9bep+0')],
+])
+
+pq_b = 1.15
+pq_g = 0.66
+pq_c1 = 3424/(2**12)
+pq_c2 = 2413/(2**7)
+pq_c3 = 2392/(2**7)
+pq_n = 2610/(2**14)
+pq_p = 1.7*2523/(2**5)
+pq_d = -0.56
+pq_d0 = 1.6295499532821566e-11
+
+# The mixing of X and Z into X' and of Y and X into Y' ahead of XYZ_LMS.
+XYZ_PRIME = np.array([
+    [pq_b, 0, -(pq_b - 1)],
+    [-(pq_g - 1), pq_g, 0],
+    [0, 0, 1],
+])
+
+# Linear RGB straight to LMS in units of 10000 cd/m2, the PQ curves' input
+# scale, and back: the matrix chains folded for the fast kernels.
+RGB1_LMSU = XYZ_LMS @ XYZ_PRIME @ RGB1_XYZ1/100
+LMSU_RGB1 = XYZ1_RGB1 @ np.linalg.inv(XYZ_PRIME) @ LMS_XYZ*100
+
+SRGB_CUT = float.fromhex('0x1.9a5c61c57a062p-9')
+
+
+def components(arr):
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.ndim < 1 or arr.shape[-1] != 3:
+        raise ValueError(f'expected an array of shape (..., 3), got {arr.shape}')
+    return arr[..., 0], arr[..., 1], arr[..., 2]
+
+
+def stack(x, y, z):
+    return np.stack([x, y, z], axis=-1)
+
+
+def matmul(arr, mat):
+    return arr @ mat.T
+
+
+ACCURACY = ('exact', 'fast', 'lut')
+
+# Largest JzAzBz.diff from the exact tier that check() accepts for each tier,
+# over sRGB255 colors, both for srgb255_to_jzazbz and for the exact forward
+# conversion of jzazbz_to_srgb255's result. A just-noticeable difference is
+# around 2e-3.
+DELTA_E_BOUND = {
+    'exact': 0.0,
+    'fast': 1e-4,
+    'lut': 1e-5,
+}
+
+def pqExact(x):
+    y = (x/10000)**pq_n
+    return ((pq_c1 + pq_c2*y)/(1 + pq_c3*y))**pq_p
+
+
+def pqInverseExact(x):
+    # Outside the PQ domain the ratio goes negative; clamping it maps those
+    # channels to black, as JzAzBz.xyz100 does.
+    y = np.maximum(x, 0)**(1/pq_p)
+    return 10000*np.maximum((pq_c1 - y)/(pq_c3*y - pq_c2), 0)**(1/pq_n)
+
+
+def pqUnitFast(u):
+    """pqExact of u*10000 cd/m2 in single precision, where NumPy's vectorized pow is faster."""
+    f = np.float32
+    y = np.asarray(u, dtype=f)**f(pq_n)
+    ratio = y*f(pq_c2)
+    ratio += f(pq_c1)
+    y *= f(pq_c3)
+    y += f(1)
+    ratio /= y
+    return np.power(ratio, f(pq_p), out=ratio)
+
+
+def pqInverseUnitFast(x):
+    """pqInverseExact(x)/10000 in single precision."""
+    f = np.float32
+    y = np.maximum(np.asarray(x, dtype=f), f(0))**f(1/pq_p)
+    ratio = f(pq_c1) - y
+    y *= f(pq_c3)
+    y -= f(pq_c2)
+    ratio /= y
+    np.maximum(ratio, f(0), out=ratio)
+    return np.power(ratio, f(1/pq_n), out=ratio)
+
+
+def pqFast(x):
+    return pqUnitFast(np.asarray(x, dtype=np.float32)*np.float32(1/10000)).astype(np.float64)
+
+
+def pqInverseFast(x):
+    return (np.float32(10000)*pqInverseUnitFast(x)).astype(np.float64)
+
+
+class BinadeTable:
+    """Piecewise-linear table of f over [2**emin, 2**(emax+1)) with 2**bits pieces per binade.
+
+    The table index is read straight from the exponent and top mantissa bits
+    of each float, so the pieces shrink with the input and the PQ curves'
+    steep start near zero costs no more entries than their flat end.
+    Inputs are clamped to the table's range first, so those below 2**emin
+    read f(2**emin) and those from 2**(emax+1) up read the end of the last
+    piece.
+    """
+
+    def __init__(self, f, emin, emax, bits):
+        e = np.arange(emin, emax + 1)[:, np.newaxis]
+        m = 1 + np.arange(1 << bits)[np.newaxis, :]/(1 << bits)
+        points = np.append(np.ldexp(m, e).ravel(), 2.0**(emax + 1))
+        values = f(points)
+        self.table = values[:-1]
+        self.slope = np.diff(values)
+        self.lo = 2.0**emin
+        self.hi = np.nextafter(2.0**(emax + 1), 0)
+        self.base = (emin + 1023) << 52
+        self.shift = 52 - bits
+
+    def __call__(self, x):
+        bits = np.clip(np.asarray(x, dtype=np.float64), self.lo, self.hi).view(np.int64) - self.base
+        i = bits >> self.shift
+        fraction = (bits & ((1 << self.shift) - 1))*2.0**-self.shift
+        return self.table[i] + self.slope[i]*fraction
+
+
+_tables = {}
+
+def pqTable(name):
+    if name not in _tables:
+        if name == 'pq':
+            # Below 2**-180 cd/m2 the curve is within 1e-9 of pq(0).
+            _tables[name] = BinadeTable(pqExact, -180, 13, 8)
+        else:
+            # Below 2**-36 the inverse is clamped to 0.
+            _tables[name] = BinadeTable(pqInverseExact, -36, 0, 8)
+    return _tables[name]
+
+
+def pq(x, accuracy='exact'):
+    if accuracy == 'exact':
+        return pqExact(x)
+    if accuracy == 'fast':
+        return pqFast(x)
+    if accuracy == 'lut':
+        return pqTable('pq')(np.asarray(x, dtype=np.float64))
+    raise ValueError(f'unknown accuracy {accuracy!r}, expected one of {ACCURACY}')
+
+
+def pqInverse(x, accuracy='exact'):
+    if accuracy == 'exact':
+        return pqInverseExact(x)
+    if accuracy == 'fast':
+        return pqInverseFast(x)
+    if accuracy == 'lut':
+        return pqTable('pqInverse')(np.asarray(x, dtype=np.float64))
+    raise ValueError(f'unknown accuracy {accuracy!r}, expected one of {ACCURACY}')
+
+
+def srgb1_to_rgb1(arr):
+    arr = np.asarray(arr, dtype=np.float64)
+    return np.where(arr <= 0.04045, arr/12.92, ((np.maximum(arr, 0.04045) + 0.055)/1.055)**2.4)
+
+
+def rgb1_to_srgb1(arr):
+    arr = np.asarray(arr, dtype=np.float64)
+    return np.where(arr <= SRGB_CUT, arr*12.92, 1.055*np.maximum(arr, SRGB_CUT)**(1/2.4) - 0.055)
+
+
+# Linear RGB of each sRGB255 code value, for integer pixels in the fast tier.
+SRGB255_RGB1 = srgb1_to_rgb1(np.arange(256)/255).astype(np.float32)
+
+
+def rgb1_to_xyz100(arr):
+    return matmul(np.asarray(arr, dtype=np.float64), RGB1_XYZ1)*100
+
+
+def xyz100_to_rgb1(arr):
+    return matmul(np.asarray(arr, dtype=np.float64)/100, XYZ1_RGB1)
+
+
+def xyz100_to_jzazbz(arr, accuracy='exact'):
+    x, y, z = components(arr)
+    x_ = pq_b*x - (pq_b-1)*z
+    y_ = pq_g*y - (pq_g-1)*x
+    lms_ = pq(matmul(stack(x_, y_, z), XYZ_LMS), accuracy)
+    iz, az, bz = components(matmul(lms_, LMS_IAB))
+    jz = ((1 + pq_d)*iz)/(1 + pq_d*iz) - pq_d0
+    return stack(jz, az, bz)
+
+
+def jzazbz_to_xyz100(arr, accuracy='exact'):
+    jz, az, bz = components(arr)
+    iz = (jz + pq_d0)/(1 + pq_d - pq_d*(jz + pq_d0))
+    lms = pqInverse(matmul(stack(iz, az, bz), IAB_LMS), accuracy)
+    x_, y_, z_ = components(matmul(lms, LMS_XYZ))
+    x = (x_ + (pq_b-1)*z_)/pq_b
+    y = (y_ + (pq_g-1)*x)/pq_g
+    return stack(x, y, z_)
+
+
+def jzazbz_to_jzczhz(arr):
+    jz, az, bz = components(arr)
+    return stack(jz, np.hypot(az, bz), np.arctan2(bz, az))
+
+
+def jzczhz_to_jzazbz(arr):
+    jz, cz, hz = components(arr)
+    return stack(jz, cz*np.cos(hz), cz*np.sin(hz))
+
+
+def jzczhz_to_jch(arr):
+    jz, cz, hz = components(arr)
+    return stack(jz/JzCzHz_jz1, cz/JzCzHz_cz1, 0.5 + hz/math.tau)
+
+
+def jch_to_jzczhz(arr):
+    j, c, h = components(arr)
+    return stack(j*JzCzHz_jz1, c*JzCzHz_cz1, (h - 0.5)*math.tau)
+
+
+def jzazbz_to_jabz(arr):
+    jz, az, bz = components(arr)
+    return stack(jz2j(jz), az2a(az), bz2b(bz))
+
+
+def jabz_to_jzazbz(arr):
+    j, a, b = components(arr)
+    return stack(j2jz(j), a2az(a), b2bz(b))
+
+
+def srgb255ToJzazbzFast(arr):
+    """The fast tier of srgb255_to_jzazbz: the sRGB curve, RGB1_LMSU and PQ in single precision."""
+    arr = np.asarray(arr)
+    f = np.float32
+    if np.issubdtype(arr.dtype, np.integer):
+        rgb = SRGB255_RGB1[arr]
+    else:
+        x = arr.astype(f)*f(1/255)
+        rgb = np.where(x <= f(0.04045), x*f(1/12.92), ((np.maximum(x, f(0.04045)) + f(0.055))*f(1/1.055))**f(2.4))
+    lms_ = pqUnitFast(rgb @ RGB1_LMSU.T.astype(f))
+    izazbz = lms_.astype(np.float64) @ LMS_IAB.T
+    iz = izazbz[..., 0]
+    izazbz[..., 0] = ((1 + pq_d)*iz)/(1 + pq_d*iz) - pq_d0
+    return izazbz
+
+
+def jzazbzToSrgb255Fast(arr):
+    """The fast tier of jzazbz_to_srgb255: PQ inverse, LMSU_RGB1 and the sRGB curve in single precision."""
+    f = np.float32
+    izazbz = np.array(arr, dtype=np.float64)
+    jz = izazbz[..., 0] + pq_d0
+    izazbz[..., 0] = jz/(1 + pq_d - pq_d*jz)
+    lms = pqInverseUnitFast(izazbz @ IAB_LMS.T)
+    rgb = lms @ LMSU_RGB1.T.astype(f)
+    srgb = np.power(np.maximum(rgb, f(SRGB_CUT)), f(1/2.4))
+    srgb *= f(1.055*255)
+    srgb -= f(0.055*255)
+    np.multiply(rgb, f(12.92*255), out=srgb, where=rgb <= f(SRGB_CUT))
+    return srgb.astype(np.float64)
+
+
+def srgb255_to_jzazbz(arr, accuracy='exact'):
+    """The exact tier is the generated folded kernel; with accuracy='lut', integer pixels are read from the jabzlut 24-bit table."""
+    arr = np.asarray(arr)
+    if accuracy not in ACCURACY:
+        raise ValueError(f'unknown accuracy {accuracy!r}, expected one of {ACCURACY}')
+    if accuracy == 'fast':
+        return srgb255ToJzazbzFast(arr)
+    if accuracy == 'lut' and np.issubdtype(arr.dtype, np.integer):
+        import jabzlut
+        return jabzlut.srgb255_to_jzazbz(arr).astype(np.float64)
+    return stack(*jabzfastnp.srgb255ToJzAzBz(*components(arr)))
+
+
+def jzazbz_to_srgb255(arr, accuracy='exact'):
+    """The exact tier is the generated folded kernel; 'lut' has no table for this direction and is an alias of 'exact'."""
+    if accuracy not in ACCURACY:
+        raise ValueError(f'unknown accuracy {accuracy!r}, expected one of {ACCURACY}')
+    if accuracy == 'fast':
+        return jzazbzToSrgb255Fast(arr)
+    return stack(*jabzfastnp.jzazbzToSrgb255(*components(arr)))
+
+
+def srgb255_to_jzczhz(arr, accuracy='exact'):
+    return jzazbz_to_jzczhz(srgb255_to_jzazbz(arr, accuracy))
+
+
+def srgb255_to_jch(arr, accuracy='exact'):
+    return jzczhz_to_jch(srgb255_to_jzczhz(arr, accuracy))
+
+
+def srgb255_to_jabz(arr, accuracy='exact'):
+    return jzazbz_to_jabz(srgb255_to_jzazbz(arr, accuracy))
+
+
+def jch_to_srgb255(arr, accuracy='exact'):
+    return jzazbz_to_srgb255(jzczhz_to_jzazbz(jch_to_jzczhz(arr)), accuracy)
+
+
+def jch_to_srgb1(arr, accuracy='exact'):
+    return jch_to_srgb255(arr, accuracy)/255
+
+
+def jabz_to_srgb255(arr, accuracy='exact'):
+    return jzazbz_to_srgb255(jabz_to_jzazbz(arr), accuracy)
+
+
+HEX = [f'{i:02x}' for i in range(256)]
+
+
+def htmlrgb(srgb255, alpha=1):
+    """List of jabz.htmlrgb strings, one per color of an (..., 3) sRGB255 array.
+
+    alpha is one value for every color or a sequence with one per color.
+    """
+    rgb = np.rint(np.clip(np.asarray(srgb255, dtype=np.float64), 0, 255)).astype(np.int64).reshape(-1, 3).tolist()
+    alphas = [alpha]*len(rgb) if np.ndim(alpha) == 0 else alpha
+    out = []
+    for (r, g, b), a in zip(rgb, alphas):
+        a = max(0, min(1, a))
+        if a != 1:
+            out.append(f'rgba({r}, {g}, {b}, {a})')
+        else:
+            out.append('#' + HEX[r] + HEX[g] + HEX[b])
+    return out
+
+
+def hashBytes(strings, n):
+    """(N, n) uint8 array of the shake_128 digests jabz.py uses, one row per string."""
+    data = b''.join(hashlib.shake_128(st.encode()).digest(n) for st in strings)
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, n)
+
+
+def chromaValues(ch, strings):
+    """(N, 2) array of jabz.chromaValues(ch, st) for each string."""
+    h = hashBytes(strings, 2)
+    x = h[:, 0]/255
+    signA = np.where(h[:, 1] & 0x1, 1, -1)
+    signB = np.where(h[:, 1] & 0x2, 1, -1)
+    return np.stack([ch*signA*x, ch*signB*(1 - x)], axis=-1)
+
+
+def jchzHash(j, c, strings, alpha=1):
+    """Array of jabz.jchzHash(j, c, st, alpha) strings: one hash byte indexes the cached palette."""
+    palette = np.array(jabz.jchzPalettes.palette(j, c, alpha))
+    return palette[hashBytes(strings, 1)[:, 0]]
+
+
+def chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def iterChromaValues(ch, strings, chunk=4096):
+    """Like chromaValues, but consumes strings lazily and yields (a, b) tuples."""
+    for block in chunks(strings, chunk):
+        yield from map(tuple, chromaValues(ch, block).tolist())
+
+
+def iterJchzHash(j, c, strings, alpha=1, chunk=4096):
+    """Like jchzHash, but consumes strings lazily and yields one color string at a time."""
+    palette = jabz.jchzPalettes.palette(j, c, alpha)
+    for block in chunks(strings, chunk):
+        yield from map(palette.__getitem__, hashBytes(block, 1)[:, 0].tolist())
+
+
+def ulpDiff(actual, expected, top):
+    """Per-color distance in units of the spacing of floats near top."""
+    actual = np.asarray(actual, dtype=np.float64)
+    expected = np.asarray(expected, dtype=np.float64)
+    return np.max(np.abs(actual - expected), axis=-1)/np.spacing(top)
+
+
+def check(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    srgb = rng.integers(0, 256, size=(n, 3)).astype(np.float64)
+    conversions = [
+        ('srgb255_to_jzazbz', srgb, srgb255_to_jzazbz, JzCzHz_jz1, lambda c: jabz.SRGB255(*c).jzazbz()),
+        ('srgb255_to_jch', srgb, srgb255_to_jch, 1.0, lambda c: jabz.SRGB255(*c).jch()),
+    ]
+    jzazbz = srgb255_to_jzazbz(srgb)
+    jch = srgb255_to_jch(srgb)
+    conversions += [
+        ('jzazbz_to_srgb255', jzazbz, jzazbz_to_srgb255, 255.0, lambda c: jabz.JzAzBz(*c).xyz100().xyz1().rgb1().srgb1().srgb255()),
+        ('jch_to_srgb255', jch, jch_to_srgb255, 255.0, lambda c: jabz.Jch(*c).jzczhz().jzazbz().xyz100().xyz1().rgb1().srgb1().srgb255()),
+    ]
+    for name, inputs, batch, top, scalar in conversions:
+        expected = np.array([scalar(c) for c in inputs.tolist()])
+        actual = batch(inputs)
+        if name == 'srgb255_to_jch':
+            # Hue is ill-conditioned near the neutral axis; compare the
+            # polar coordinates as points in the plane instead.
+            actual, expected = (stack(j, c*np.cos(h*math.tau), c*np.sin(h*math.tau)) for j, c, h in (components(actual), components(expected)))
+        ulps = ulpDiff(actual, expected, top)
+        print(f'{name}: max {ulps.max():.0f} ulp, mean {ulps.mean():.2f} ulp')
+        assert ulps.max() <= ULP_TOLERANCE, name
+
+    colors = rng.uniform(-20, 275, size=(1000, 3))
+    alphas = rng.choice([1, 0.5, 2], size=len(colors)).tolist()
+    assert htmlrgb(colors, alphas) == [jabz.htmlrgb(*c, a) for c, a in zip(colors.tolist(), alphas)]
+
+
+def checkAccuracy(n=20000, seed=0):
+    """Measure each tier against the exact one with JzAzBz.diff and assert DELTA_E_BOUND; bench.py checks their speed."""
+    rng = np.random.default_rng(seed)
+    srgb = rng.integers(0, 256, size=(n, 3))
+    exact = srgb255_to_jzazbz(srgb)
+    exactSrgb = srgb255_to_jzazbz(jzazbz_to_srgb255(exact))
+    for accuracy in ACCURACY:
+        cases = [('forward', srgb255_to_jzazbz(srgb, accuracy), exact)]
+        if accuracy != 'lut':
+            cases.append(('inverse', srgb255_to_jzazbz(jzazbz_to_srgb255(exact, accuracy)), exactSrgb))
+        errors = {name: max(jabz.JzAzBz(*a).diff(jabz.JzAzBz(*e)) for a, e in zip(approx.tolist(), expected.tolist())) for name, approx, expected in cases}
+        print(f'{accuracy:5}: max dEz ' + ', '.join(f'{name} {e:.2e}' for name, e in errors.items()) + f' (bound {DELTA_E_BOUND[accuracy]:.0e})')
+        assert max(errors.values()) <= DELTA_E_BOUND[accuracy], accuracy
+
+
+if __name__ == '__main__':
+    check()
+    checkAccuracy()
@@ -0,0 +1,157 @@
+"""Convert images across worker processes, tile by tile, through shared memory.
+
+The source pixels and the result live in multiprocessing.shared_memory
+segments that every worker maps once, so a tile task is just a row range:
+no pixel data is pickled. Each worker applies one of the farbfeld.maps batch
+conversions to its rows in place.
+
+    python3 parallel.py ff2jchz in.ff out.ff --workers 32
+"""
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import farbfeld
+
+
+TILE_PIXELS = 1 << 16
+
+
+class SharedArray:
+    """A NumPy array in a named shared memory segment; pickles as its name, shape and dtype."""
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape))*self.dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+
+    def __reduce__(self):
+        return (SharedArray, (self.shape, self.dtype, self.shm.name))
+
+    def close(self):
+        del self.array
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+_worker = None
+
+def initWorker(src, dst, mode, encode):
+    global _worker
+    _worker = (src, dst, farbfeld.maps[mode], encode and farbfeld.modes[encode])
+
+
+def convertRows(y0, y1):
+    src, dst, map, encode = _worker
+    block = src.array[y0:y1]
+    if block.dtype == farbfeld.FF16:
+        block = block/0xFFFF
+    if block.shape[-1] == 3:
+        rgba1 = np.concatenate([block, np.ones(block.shape[:-1] + (1,))], axis=-1)
+        dst.array[y0:y1] = map(rgba1)[..., :3]
+    elif encode:
+        dst.array[y0:y1] = encode(map(block))
+    else:
+        dst.array[y0:y1] = map(block)
+
+
+def tiles(height, width, workers, rows=None):
+    rows = rows or max(1, min(TILE_PIXELS//max(1, width), -(-height//(4*workers))))
+    return [(y, min(y + rows, height)) for y in range(0, height, rows)]
+
+
+def loadFarbfeld(f):
+    width, height = farbfeld.readHeader(f)
+    src = SharedArray((height, width, 4), farbfeld.FF16)
+    view = memoryview(src.shm.buf)[:height*width*8]
+    n = 0
+    while n < len(view):
+        got = f.readinto(view[n:])
+        if not got:
+            view.release()
+            src.unlink()
+            raise ValueError(f'truncated farbfeld data: expected {len(view)} bytes, got {n}')
+        n += got
+    view.release()
+    return src
+
+
+def convert_image_parallel(src, mode, workers=None, dst=None, encode='mask', tile_rows=None):
+    """Convert an image with the farbfeld.maps conversion named by mode.
+
+    src is either an (H, W, 3) or (H, W, 4) array of floats, returning a
+    float64 array of the same shape, or a farbfeld path or binary file,
+    returning the (H, W, 4) big-endian uint16 pixels encoded with encode
+    ('mask' or 'clip', as the C++ tools). With dst (a path or binary file)
+    a farbfeld result is written there instead of being returned.
+    """
+    workers = workers or os.cpu_count() or 1
+    if mode not in farbfeld.maps:
+        raise ValueError(f'unknown conversion {mode!r}, expected one of {sorted(farbfeld.maps)}')
+    if isinstance(src, np.ndarray):
+        if src.ndim != 3 or src.shape[-1] not in (3, 4):
+            raise ValueError(f'expected an (H, W, 3) or (H, W, 4) image, got {src.shape}')
+        if dst is not None:
+            raise ValueError('dst is only supported for farbfeld sources')
+        shared = SharedArray(src.shape, np.float64)
+        shared.array[...] = src
+        encode = None
+    else:
+        if encode not in farbfeld.modes:
+            raise ValueError(f'unknown encoding {encode!r}, expected one of {sorted(farbfeld.modes)}')
+        if isinstance(src, (str, os.PathLike)):
+            with open(src, 'rb') as f:
+                shared = loadFarbfeld(f)
+        else:
+            shared = loadFarbfeld(src)
+
+    out = None
+    try:
+        out = SharedArray(shared.shape, shared.dtype)
+        height, width = shared.shape[:2]
+        bands = tiles(height, width, workers, tile_rows)
+        with ProcessPoolExecutor(workers, initializer=initWorker, initargs=(shared, out, mode, encode)) as pool:
+            list(pool.map(convertRows, [y0 for y0, y1 in bands], [y1 for y0, y1 in bands]))
+        if dst is None:
+            return out.array.copy()
+        with out.shm.buf[:out.array.nbytes] as data:
+            if isinstance(dst, (str, os.PathLike)):
+                with open(dst, 'wb') as f:
+                    farbfeld.writeHeader(f, width, height)
+                    f.write(data)
+            else:
+                farbfeld.writeHeader(dst, width, height)
+                dst.write(data)
+                dst.flush()
+    finally:
+        shared.unlink()
+        if out is not None:
+            out.unlink()
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='parallel.py', description='Map farbfeld pixels between sRGB and jabz/jchz on every core.')
+    parser.add_argument('map', choices=sorted(farbfeld.maps))
+    parser.add_argument('--clip', dest='encode', action='store_const', const='clip', default='mask', help='clamp out-of-range channels instead of masking the pixel')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--rows', type=int, help='rows per tile')
+    parser.add_argument('input', nargs='?', help='input file (default: stdin)')
+    parser.add_argument('output', nargs='?', help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    convert_image_parallel(args.input or sys.stdin.buffer, args.map, args.workers, args.output or sys.stdout.buffer, args.encode, args.rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
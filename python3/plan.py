@@ -0,0 +1,205 @@
+"""Conversion plans: each run of linear steps between two spaces folded into one affine map.
+
+The jabz.py chains are broken into their smallest steps, on a graph that adds
+the internal LMS, PQ-encoded LMS' and IzAzBz stages to the ColorArray spaces.
+plan() finds the path between two spaces and composes every run of adjacent
+affine steps with A3 @, so only the unavoidable nonlinear curves remain:
+
+    plan('jabz', 'srgb255').stages
+    # [A3 (jabz -> jzazbz), Iz, A3 (-> lms'), PQ inverse, A3 (-> rgb1), sRGB curve, A3 (-> srgb255)]
+
+A plan converts a single color (a tuple such as a jabz.py NamedTuple, giving a
+NamedTuple of the target class) or an array of shape (..., 3). Plans are cached
+per (source, target).
+"""
+
+import functools
+import math
+import typing
+
+import numpy as np
+
+import colorarray
+import jabz
+import jabznp
+from affine import A2, A3
+from jabznp import pq_b, pq_g, pq_c1, pq_c2, pq_c3, pq_n, pq_p, pq_d, pq_d0
+
+
+class Curve(typing.NamedTuple):
+    """A nonlinear step: scalar(x, y, z) -> (x, y, z), array(arr, accuracy) -> arr."""
+    name : str
+    scalar : typing.Callable
+    array : typing.Callable
+
+    def __repr__(self):
+        return f'Curve({self.name!r})'
+
+
+def pqScalar(x):
+    y = (x/10000)**pq_n
+    return ((pq_c1 + pq_c2*y)/(1 + pq_c3*y))**pq_p
+
+
+def pqInverseScalar(x):
+    if x < 0:
+        return 0
+    y = x**(1/pq_p)
+    return 10000*max(0, (pq_c1 - y)/(pq_c3*y - pq_c2))**(1/pq_n)
+
+
+def jzToIz(jz):
+    return (jz + pq_d0)/(1 + pq_d - pq_d*(jz + pq_d0))
+
+
+def izToJz(iz):
+    return ((1 + pq_d)*iz)/(1 + pq_d*iz) - pq_d0
+
+
+def perChannel(name, f, array):
+    return Curve(name, lambda x, y, z: (f(x), f(y), f(z)), array)
+
+
+def firstChannel(name, f):
+    def array(arr, accuracy):
+        out = np.array(arr, dtype=np.float64)
+        out[..., 0] = f(out[..., 0])
+        return out
+    return Curve(name, lambda x, y, z: (f(x), y, z), array)
+
+
+SRGB_LINEAR = perChannel('sRGB to linear', jabz.c_linear, lambda a, accuracy: jabznp.srgb1_to_rgb1(a))
+LINEAR_SRGB = perChannel('linear to sRGB', jabz.c_srgb, lambda a, accuracy: jabznp.rgb1_to_srgb1(a))
+PQ = perChannel('PQ', pqScalar, jabznp.pq)
+PQ_INVERSE = perChannel('PQ inverse', pqInverseScalar, jabznp.pqInverse)
+IZ_JZ = firstChannel('Iz to Jz', izToJz)
+JZ_IZ = firstChannel('Jz to Iz', jzToIz)
+POLAR = Curve('to polar', lambda jz, az, bz: (jz, math.hypot(az, bz), math.atan2(bz, az)), lambda a, accuracy: jabznp.jzazbz_to_jzczhz(a))
+CARTESIAN = Curve('to cartesian', lambda jz, cz, hz: (jz, cz*math.cos(hz), cz*math.sin(hz)), lambda a, accuracy: jabznp.jzczhz_to_jzazbz(a))
+
+
+def scale(s):
+    return A3.diag(A2(s, 0.0), A2(s, 0.0), A2(s, 0.0))
+
+
+# The mixing of X and Z into X' and of Y and X into Y' ahead of the LMS matrix.
+XYZ_PRIME = A3.linear([[pq_b, 0, -(pq_b - 1)], [-(pq_g - 1), pq_g, 0], [0, 0, 1]])
+
+steps = {
+    ('srgb255', 'srgb1'): scale(1/255),
+    ('srgb1', 'srgb255'): scale(255.0),
+    ('srgb1', 'rgb1'): SRGB_LINEAR,
+    ('rgb1', 'srgb1'): LINEAR_SRGB,
+    ('rgb1', 'xyz1'): A3.linear(jabznp.RGB1_XYZ1),
+    ('xyz1', 'rgb1'): A3.linear(jabznp.XYZ1_RGB1),
+    ('xyz1', 'xyz100'): scale(100.0),
+    ('xyz100', 'xyz1'): scale(1/100),
+    ('xyz100', 'lms'): A3.linear(jabznp.XYZ_LMS) @ XYZ_PRIME,
+    ('lms', 'xyz100'): XYZ_PRIME.inverse() @ A3.linear(jabznp.LMS_XYZ),
+    ('lms', 'lms_'): PQ,
+    ('lms_', 'lms'): PQ_INVERSE,
+    ('lms_', 'izazbz'): A3.linear(jabznp.LMS_IAB),
+    ('izazbz', 'lms_'): A3.linear(jabznp.IAB_LMS),
+    ('izazbz', 'jzazbz'): IZ_JZ,
+    ('jzazbz', 'izazbz'): JZ_IZ,
+    ('jzazbz', 'jabz'): A3.diag(jabz.jz2j, jabz.az2a, jabz.bz2b),
+    ('jabz', 'jzazbz'): A3.diag(jabz.j2jz, jabz.a2az, jabz.b2bz),
+    ('jzazbz', 'jzczhz'): POLAR,
+    ('jzczhz', 'jzazbz'): CARTESIAN,
+    ('jzczhz', 'jch'): A3.diag(A2(1/jabz.JzCzHz_jz1, 0.0), A2(1/jabz.JzCzHz_cz1, 0.0), A2(1/math.tau, 0.5)),
+    ('jch', 'jzczhz'): A3.diag(A2(jabz.JzCzHz_jz1, 0.0), A2(jabz.JzCzHz_cz1, 0.0), A2(math.tau, -0.5*math.tau)),
+}
+
+
+def fuse(stages):
+    """Compose each run of adjacent A3 maps into one."""
+    fused = []
+    for stage in stages:
+        if isinstance(stage, A3) and fused and isinstance(fused[-1], A3):
+            fused[-1] = stage @ fused[-1]
+        else:
+            fused.append(stage)
+    return fused
+
+
+class Plan:
+    __slots__ = ('src', 'dst', 'stages', 'arrays')
+
+    def __init__(self, src, dst, stages):
+        self.src = src
+        self.dst = dst
+        self.stages = stages
+        self.arrays = [arrayStage(s) for s in stages]
+
+    def __call__(self, color, accuracy='exact'):
+        """Convert one color (a tuple, e.g. a jabz.py NamedTuple) to a NamedTuple, or an (..., 3) array to an array.
+
+        accuracy applies to the PQ curves of array conversions, as in jabznp.
+        """
+        if not isinstance(color, tuple):
+            arr = np.asarray(color, dtype=np.float64)
+            for f in self.arrays:
+                arr = f(arr, accuracy)
+            return arr
+        for stage in self.stages:
+            color = stage.scalar(*color) if isinstance(stage, Curve) else stage(color)
+        return colorarray.classes[self.dst](*color)
+
+    def __repr__(self):
+        return f'Plan({self.src!r}, {self.dst!r}, {self.stages!r})'
+
+
+def arrayStage(stage):
+    if isinstance(stage, Curve):
+        return stage.array
+    m = np.array(stage.m).T
+    if stage.isLinear():
+        return lambda arr, accuracy: arr @ m
+    a = np.array(stage.a)
+    return lambda arr, accuracy: arr @ m + a
+
+
+@functools.lru_cache(maxsize=None)
+def plan(src, dst):
+    """The compiled conversion from space src to dst (names as in colorarray.classes)."""
+    for space in (src, dst):
+        if space not in colorarray.classes:
+            raise ValueError(f'unknown color space {space!r}, expected one of {sorted(colorarray.classes)}')
+    return Plan(src, dst, fuse([steps[s] for s in colorarray.route(src, dst, steps)]))
+
+
+def convert(color, src, dst, accuracy='exact'):
+    return plan(src, dst)(color, accuracy)
+
+
+def check(n=20000, seed=0):
+    import timeit
+
+    rng = np.random.default_rng(seed)
+    srgb = rng.integers(0, 256, size=(n, 3)).astype(np.float64)
+    jabzs = jabznp.srgb255_to_jabz(srgb)
+    jchs = jabznp.srgb255_to_jch(srgb)
+    cases = [
+        ('srgb255', 'jzazbz', srgb, jabznp.srgb255_to_jzazbz, jabz.JzCzHz_jz1),
+        ('srgb255', 'jabz', srgb, jabznp.srgb255_to_jabz, 1.0),
+        ('jabz', 'srgb255', jabzs, jabznp.jabz_to_srgb255, 255.0),
+        ('jch', 'srgb255', jchs, jabznp.jch_to_srgb255, 255.0),
+    ]
+    for src, dst, inputs, batch, top in cases:
+        p = plan(src, dst)
+        expected = batch(inputs)
+        ulps = jabznp.ulpDiff(p(inputs), expected, top)
+        scalar = np.array([p(tuple(c)) for c in inputs[:2000].tolist()])
+        scalarUlps = jabznp.ulpDiff(scalar, expected[:2000], top)
+        tPlan = min(timeit.repeat(lambda: p(inputs), number=10, repeat=3))/10
+        tBatch = min(timeit.repeat(lambda: batch(inputs), number=10, repeat=3))/10
+        kinds = ' '.join('A3' if isinstance(s, A3) else s.name.replace(' ', '-') for s in p.stages)
+        print(f'{src} -> {dst}: [{kinds}]')
+        print(f'  max {ulps.max():.0f} ulp (scalar {scalarUlps.max():.0f}) from jabznp; {n/tPlan/1e6:.1f} vs {n/tBatch/1e6:.1f} Mpixel/s')
+        assert max(ulps.max(), scalarUlps.max()) <= jabznp.ULP_TOLERANCE, (src, dst)
+    assert plan('jch', 'srgb255') is plan('jch', 'srgb255')
+    assert isinstance(convert(jabz.Jch(0.5, 0.3, 0.1), 'jch', 'srgb255'), jabz.SRGB255)
+
+
+if __name__ == '__main__':
+    check()
@@ -0,0 +1,209 @@
+"""Reduce images to a few colors, choosing the palette in JzAzBz.
+
+quantize() streams integer sRGB pixels, keeps a uniform reservoir sample of at
+most `sample` of them, converts only the sample to JzAzBz, seeds the palette
+by median cut and refines it with mini-batch k-means. remap() then gives each
+pixel its nearest palette entry by dEz through a table over all 2**24 sRGB
+colors, working out each entry the first time a pixel needs it.
+
+    python3 quantize.py 16 < in.ff > out.ff
+"""
+
+import sys
+import typing
+
+import numpy as np
+
+import deltae
+import jabznp
+
+
+CHUNK = 1 << 20
+
+
+class Palette(typing.NamedTuple):
+    jzazbz: np.ndarray
+    srgb255: np.ndarray
+
+
+def chunks(pixels, size=CHUNK):
+    """(k, 3) pieces of an (..., 3) array, or the pieces of an iterable of arrays."""
+    if isinstance(pixels, np.ndarray):
+        pixels = [pixels]
+    for block in pixels:
+        block = np.asarray(block).reshape(-1, 3)
+        for i in range(0, len(block), size):
+            yield block[i:i + size]
+
+
+def reservoir(pixels, size, rng):
+    """Uniform sample of at most size rows from a stream of (k, 3) chunks."""
+    sample = None
+    seen = 0
+    for block in chunks(pixels):
+        if sample is None:
+            sample = np.empty((size, 3), dtype=block.dtype)
+        fill = min(len(block), max(0, size - seen))
+        sample[seen:seen + fill] = block[:fill]
+        rest = block[fill:]
+        position = seen + fill + np.arange(1, len(rest) + 1)
+        keep = rng.random(len(rest)) < size/position
+        sample[rng.integers(0, size, keep.sum())] = rest[keep]
+        seen += len(block)
+    if sample is None:
+        raise ValueError('no pixels to quantize')
+    return sample[:min(seen, size)]
+
+
+def medianCut(points, n):
+    """Means of n boxes, splitting the box with the widest extent at its median each time."""
+    boxes = [np.arange(len(points))]
+    while len(boxes) < n:
+        extents = [np.ptp(points[box], axis=0) if len(box) > 1 else np.zeros(3) for box in boxes]
+        widest = max(range(len(boxes)), key=lambda i: extents[i].max())
+        if extents[widest].max() == 0:
+            break
+        box = boxes.pop(widest)
+        axis = extents[widest].argmax()
+        order = box[np.argsort(points[box, axis], kind='stable')]
+        half = len(order)//2
+        boxes += [order[:half], order[half:]]
+    return np.array([points[box].mean(axis=0) for box in boxes])
+
+
+def nearest(points, centers):
+    """Index of the nearest center to each point, comparing squared dEz a component at a time."""
+    rows = max(1, (1 << 20)//len(centers))
+    out = np.empty(len(points), dtype=np.intp)
+    for i in range(0, len(points), rows):
+        block = points[i:i + rows]
+        d = (block[:, 0, np.newaxis] - centers[:, 0])**2
+        d += (block[:, 1, np.newaxis] - centers[:, 1])**2
+        d += (block[:, 2, np.newaxis] - centers[:, 2])**2
+        out[i:i + rows] = np.argmin(d, axis=1)
+    return out
+
+
+def miniBatchKMeans(points, centers, batch=4096, iterations=50, rng=None):
+    """Sculley's mini-batch k-means: each center moves by the mean of its batch members, weighted by 1/count."""
+    rng = rng or np.random.default_rng()
+    centers = centers.copy()
+    counts = np.zeros(len(centers))
+    for i in range(iterations):
+        x = points[rng.integers(0, len(points), min(batch, len(points)))]
+        label = nearest(x, centers)
+        n = np.bincount(label, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, label, x)
+        counts += n
+        moved = n > 0
+        centers[moved] += (sums[moved] - n[moved, np.newaxis]*centers[moved])/counts[moved, np.newaxis]
+    return centers
+
+
+def quantize(pixels, n=16, sample=1 << 18, batch=4096, iterations=50, seed=0, accuracy='exact'):
+    """Palette of up to n colors for integer sRGB pixels: an (..., 3) array or an iterable of them."""
+    rng = np.random.default_rng(seed)
+    points = jabznp.srgb255_to_jzazbz(reservoir(pixels, sample, rng), accuracy)
+    centers = miniBatchKMeans(points, medianCut(points, n), batch, iterations, rng)
+    srgb255 = np.clip(np.rint(jabznp.jzazbz_to_srgb255(centers)), 0, 255).astype(np.uint8)
+    return Palette(centers, srgb255)
+
+
+def remap(pixels, palette, accuracy='exact'):
+    """Index of the nearest palette color for each pixel of an (..., 3) array, or per chunk of an iterable."""
+    if len(palette.jzazbz) > 256:
+        index = deltae.PaletteIndex(palette.jzazbz)
+        search = lambda points: index.nearest(points)[0][:, 0]
+    else:
+        search = lambda points: nearest(points, palette.jzazbz)
+    # Palette index of each 24-bit color code, -1 until a pixel needs it.
+    known = np.full(1 << 24, -1, dtype=np.int16 if len(palette.jzazbz) < 1 << 15 else np.int32)
+    pending = np.zeros(1 << 24, dtype=bool)
+
+    def lookup(block):
+        block = np.asarray(block)
+        codes = (block[..., 0].astype(np.intp) << 16) | (block[..., 1].astype(np.intp) << 8) | block[..., 2]
+        labels = known[codes]
+        missing = codes[labels < 0]
+        if missing.size:
+            # Marking the codes in a flag table dedups them without a sort.
+            pending[missing] = True
+            missing = np.flatnonzero(pending)
+            pending[missing] = False
+            colors = np.stack([missing >> 16, (missing >> 8) & 0xFF, missing & 0xFF], axis=-1)
+            known[missing] = search(jabznp.srgb255_to_jzazbz(colors, accuracy))
+            labels = known[codes]
+        return labels
+
+    if isinstance(pixels, np.ndarray):
+        flat = pixels.reshape(-1, 3)
+        out = np.concatenate([lookup(block) for block in chunks(flat)]) if flat.size else np.empty(0, known.dtype)
+        return out.reshape(pixels.shape[:-1])
+    return (lookup(block) for block in pixels)
+
+
+def check(n=16, seed=0, large=20_000_000):
+    import timeit
+
+    rng = np.random.default_rng(seed)
+    # A smooth synthetic image: two hue ramps and a lightness ramp.
+    y, x = np.mgrid[0:1000, 0:1000]/999
+    image = np.stack([255*x, 255*y, 255*(1 - x)*y + 64*np.sin(20*x)**2], axis=-1)
+    image = np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+
+    t = timeit.default_timer()
+    palette = quantize(image, n)
+    tq = timeit.default_timer() - t
+    t = timeit.default_timer()
+    labels = remap(image, palette)
+    tr = timeit.default_timer() - t
+    jzazbz = jabznp.srgb255_to_jzazbz(image.reshape(-1, 3))
+    error = deltae.diff(jzazbz, palette.jzazbz[labels.ravel()])
+
+    srgbCenters = medianCut(image.reshape(-1, 3).astype(np.float64)[::37], n)
+    srgbPalette = np.clip(np.rint(srgbCenters), 0, 255)
+    srgbLabels = nearest(image.reshape(-1, 3)[::37].astype(np.float64), srgbPalette)
+    srgbError = deltae.diff(jzazbz[::37], jabznp.srgb255_to_jzazbz(srgbPalette[srgbLabels]))
+    print(f'quantize {tq:.2f}s, remap {tr:.2f}s for {image.shape[0]*image.shape[1]/1e6:.0f} Mpixel')
+    print(f'mean dEz {error.mean():.4f} (JzAzBz k-means) vs {srgbError.mean():.4f} (sRGB median cut)')
+
+    # Uniform noise: most pixels are a color no other pixel has.
+    noise = rng.integers(0, 256, size=(large, 3), dtype=np.uint8)
+    t = timeit.default_timer()
+    noisePalette = quantize(noise, n)
+    tq = timeit.default_timer() - t
+    t = timeit.default_timer()
+    noiseLabels = remap(noise, noisePalette)
+    tr = timeit.default_timer() - t
+    sample = noise[::9973]
+    assert np.array_equal(noiseLabels[::9973], nearest(jabznp.srgb255_to_jzazbz(sample), noisePalette.jzazbz))
+    print(f'quantize {tq:.2f}s, remap {tr:.2f}s for {large/1e6:.0f} Mpixel of noise')
+
+    # A large palette full of repeats goes through deltae.PaletteIndex.
+    colors = jabznp.srgb255_to_jzazbz(rng.integers(0, 256, size=(50, 3)))
+    big = colors[rng.integers(0, 50, size=4096)]
+    bigPalette = Palette(big, np.clip(np.rint(jabznp.jzazbz_to_srgb255(big)), 0, 255).astype(np.uint8))
+    sample = image.reshape(-1, 3)[::97]
+    labels = remap(sample, bigPalette)
+    expected = nearest(jabznp.srgb255_to_jzazbz(sample), big)
+    assert np.array_equal(big[labels], big[expected])
+    print(f'remap to {len(big)} colors ({len(colors)} distinct) agrees with brute force')
+
+
+def main(argv):
+    import farbfeld
+
+    n = int(argv[0]) if argv else 16
+    rgba1 = farbfeld.read(sys.stdin.buffer)
+    srgb255 = np.clip(np.rint(rgba1[..., :3]*255), 0, 255).astype(np.uint8)
+    palette = quantize(srgb255, n)
+    rgba1[..., :3] = palette.srgb255[remap(srgb255, palette)]/255
+    farbfeld.write(sys.stdout.buffer, rgba1, 'clip')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['check']:
+        check()
+    else:
+        main(sys.argv[1:])
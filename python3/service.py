@@ -0,0 +1,474 @@
+"""Serve jabz(), jchz() and jchzHash() to many clients, converting in micro-batches.
+
+The server speaks JSON lines over a Unix socket (or TCP). Each request line
+names one of the jabz.py string functions and its arguments, and gets one
+reply line with the same id; replies may come back out of order:
+
+    {"id": 7, "op": "jchz", "args": [0.6, 0.3, 0.25]}
+    {"id": 7, "result": "#878dc8"}
+    {"id": 8, "op": "jchzHash", "args": [0.6, 0.3, "series-8", 0.5]}
+    {"id": 8, "result": "rgba(93, 159, 194, 0.5)"}
+    {"id": 9, "op": "metrics"}
+
+Requests from every connection go through one bounded queue. The batcher takes
+the first waiting request, collects more for up to --window-ms or until
+--max-batch, and converts each op's share with one jabznp call. When the queue
+is full, connections stop reading until it drains, so a flood of requests
+pushes back on the sockets instead of growing memory.
+
+    python3 service.py serve --unix /tmp/jabz.sock --window-ms 2
+    python3 service.py load --unix /tmp/jabz.sock --connections 64 --requests 50000
+    python3 service.py load      # against a server in this process, checking every reply
+
+The load test reports p50/p99 request latency next to calling jabz.py
+directly, one color per call.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import jabz
+import jabznp
+
+
+def alphas(args):
+    return [a[3] if len(a) > 3 else 1 for a in args]
+
+
+def batchJabz(args):
+    jab = np.array([a[:3] for a in args], dtype=np.float64)
+    return jabznp.htmlrgb(jabznp.jabz_to_srgb255(jab), alphas(args))
+
+
+def batchJchz(args):
+    jch = np.array([a[:3] for a in args], dtype=np.float64)
+    return jabznp.htmlrgb(jabznp.jch_to_srgb255(jch), alphas(args))
+
+
+def batchJchzHash(args):
+    # The hash byte picks palette entry h, which is jchz(j, c, h/255), so
+    # the hue can be converted directly instead of through jchzPalettes.
+    h = jabznp.hashBytes([a[2] for a in args], 1)[:, 0]/255
+    jch = np.column_stack([np.array([a[:2] for a in args], dtype=np.float64), h])
+    return jabznp.htmlrgb(jabznp.jch_to_srgb255(jch), alphas(args))
+
+
+# op: (batch function of a list of argument lists, jabz.py function, argument types)
+ops = {
+    'jabz': (batchJabz, jabz.jabz, (float, float, float)),
+    'jchz': (batchJchz, jabz.jchz, (float, float, float)),
+    'jchzHash': (batchJchzHash, jabz.jchzHash, (float, float, str)),
+}
+
+
+def parseRequest(line):
+    """(id, op, args, error) from a request line; error is None unless the request is malformed."""
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return None, None, None, f'bad JSON: {e}'
+    if not isinstance(request, dict):
+        return None, None, None, 'expected a JSON object'
+    id, op, args = request.get('id'), request.get('op'), request.get('args', [])
+    if op == 'metrics':
+        return id, op, args, None
+    if op not in ops:
+        return id, op, args, f'unknown op {op!r}, expected one of {[*ops, "metrics"]}'
+    if not isinstance(args, list) or not 3 <= len(args) <= 4:
+        return id, op, args, f'{op} takes 3 or 4 arguments'
+    for x, t in zip(args, ops[op][2] + (float,)):
+        if isinstance(x, bool) or not isinstance(x, (int, float) if t is float else t):
+            return id, op, args, f'bad {op} arguments {args!r}'
+        if isinstance(x, float) and not math.isfinite(x):
+            return id, op, args, f'{op} arguments must be finite, got {args!r}'
+    return id, op, args, None
+
+
+def convertOne(op, args):
+    """The result of one request, or the exception converting it raised."""
+    try:
+        return ops[op][0]([args])[0]
+    except Exception as e:
+        return e
+
+
+def convert(groups):
+    """{op: results} for {op: argument lists}.
+
+    When an op's batch fails, its requests are converted one at a time, so an
+    exception is the result of only the request that raised it.
+    """
+    results = {}
+    for op, args in groups.items():
+        try:
+            results[op] = ops[op][0](args)
+        except Exception:
+            results[op] = [convertOne(op, a) for a in args]
+    return results
+
+
+def percentiles(values, qs=(50, 99)):
+    return [float(p) for p in np.percentile(values, qs)] if len(values) else [0.0]*len(qs)
+
+
+class Batcher:
+    """Coalesces submitted conversions into batches.
+
+    A batch starts with the oldest waiting request and takes more until it
+    holds maxBatch or window seconds have passed. Batches are converted one at
+    a time in a worker thread, so the event loop keeps serving sockets.
+    """
+
+    def __init__(self, window=0.002, maxBatch=4096, queueSize=16384, history=1024):
+        self.window = window
+        self.maxBatch = maxBatch
+        self.queue = asyncio.Queue(queueSize)
+        self.requests = 0
+        self.batches = 0
+        self.sizes = collections.deque(maxlen=history)
+        self.latencies = collections.deque(maxlen=history)
+        self.convertTimes = collections.deque(maxlen=history)
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, op, args):
+        """Queue one conversion, waiting while the queue is full; returns the future of its result."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((op, args, future, time.perf_counter()))
+        return future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.maxBatch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            groups = collections.defaultdict(list)
+            for item in batch:
+                groups[item[0]].append(item)
+            t = time.perf_counter()
+            results = await loop.run_in_executor(None, convert, {op: [item[1] for item in items] for op, items in groups.items()})
+            done = time.perf_counter()
+            for op, items in groups.items():
+                for (_, _, future, _), result in zip(items, results[op]):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+            self.requests += len(batch)
+            self.batches += 1
+            self.sizes.append(len(batch))
+            self.convertTimes.append(done - t)
+            self.latencies.append(time.perf_counter() - min(item[3] for item in batch))
+
+    def metrics(self):
+        """Counters, plus batch size and latency over the last history batches.
+
+        latency runs from the oldest request's arrival to its batch's results;
+        convert is the time spent in the jabznp calls alone.
+        """
+        latency50, latency99 = percentiles(self.latencies)
+        convert50, convert99 = percentiles(self.convertTimes)
+        size50, size99 = percentiles(self.sizes)
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'queued': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'batch_size': {'mean': float(np.mean(self.sizes)) if self.sizes else 0.0, 'p50': size50, 'p99': size99, 'max': max(self.sizes, default=0)},
+            'batch_latency_ms': {'p50': latency50*1e3, 'p99': latency99*1e3},
+            'convert_ms': {'p50': convert50*1e3, 'p99': convert99*1e3},
+        }
+
+
+def reply(id, future):
+    try:
+        return {'id': id, 'result': future.result()}
+    except Exception as e:
+        return {'id': id, 'error': f'{type(e).__name__}: {e}'}
+
+
+async def handle(batcher, reader, writer):
+    """Serve one connection until the client closes its side and every reply is written."""
+    pending = set()
+
+    def send(message):
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b'\n')
+
+    def done(future, id):
+        pending.discard(future)
+        if not future.cancelled():
+            send(reply(id, future))
+
+    try:
+        while line := await reader.readline():
+            id, op, args, error = parseRequest(line)
+            if error:
+                send({'id': id, 'error': error})
+            elif op == 'metrics':
+                send({'id': id, 'result': batcher.metrics()})
+            else:
+                future = await batcher.submit(op, args)
+                pending.add(future)
+                future.add_done_callback(lambda f, id=id: done(f, id))
+            await writer.drain()
+        if pending:
+            await asyncio.wait(set(pending))
+        await writer.drain()
+    except (ConnectionError, ValueError):
+        # ValueError: a request line longer than the reader's limit.
+        pass
+    finally:
+        for future in pending:
+            future.cancel()
+        writer.close()
+
+
+async def startServer(path=None, host='127.0.0.1', port=0, window=0.002, maxBatch=4096, queueSize=16384):
+    """(server, batcher) listening on the Unix socket path, or on host:port."""
+    batcher = Batcher(window, maxBatch, queueSize)
+    batcher.start()
+
+    def handler(reader, writer):
+        return handle(batcher, reader, writer)
+
+    if path:
+        server = await asyncio.start_unix_server(handler, path)
+    else:
+        server = await asyncio.start_server(handler, host, port)
+    return server, batcher
+
+
+async def serve(path=None, host='127.0.0.1', port=0, **options):
+    server, batcher = await startServer(path, host, port, **options)
+    if not path:
+        host, port = server.sockets[0].getsockname()[:2]
+        path = f'{host}:{port}'
+    print(f'serving on {path}', file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def workload(n, seed=0):
+    """n (op, args) requests: a mix of the three ops, with jchzHash over a few (j, c, alpha)."""
+    rng = np.random.default_rng(seed)
+    styles = [(0.6, 0.5, 1), (0.4, 0.3, 1), (0.8, 0.2, 0.5)]
+    requests = []
+    for i, (kind, x, y, z) in enumerate(zip(rng.integers(0, 3, n).tolist(), *rng.random((3, n)).tolist())):
+        if kind == 0:
+            requests.append(('jabz', [x, 2*y - 1, 2*z - 1]))
+        elif kind == 1:
+            requests.append(('jchz', [x, y, z]))
+        else:
+            j, c, alpha = styles[i % len(styles)]
+            requests.append(('jchzHash', [j, c, f'series-{i}', alpha]))
+    return requests
+
+
+async def connect(path=None, host='127.0.0.1', port=0):
+    if path:
+        return await asyncio.open_unix_connection(path)
+    return await asyncio.open_connection(host, port)
+
+
+async def client(requests, address):
+    """Send requests one at a time on a connection; (latencies, results)."""
+    reader, writer = await connect(*address)
+    latencies = []
+    results = []
+    for i, (op, args) in enumerate(requests):
+        t = time.perf_counter()
+        writer.write(json.dumps({'id': i, 'op': op, 'args': args}).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - t)
+        results.append(response.get('result', response.get('error')))
+    writer.close()
+    await writer.wait_closed()
+    return latencies, results
+
+
+async def metrics(address):
+    reader, writer = await connect(*address)
+    writer.write(b'{"id": 0, "op": "metrics"}\n')
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return response['result']
+
+
+async def loadTest(requests, connections, address):
+    """Spread requests over connections, each sending one at a time; (latencies, results, seconds)."""
+    shares = [requests[i::connections] for i in range(connections)]
+    t = time.perf_counter()
+    outcomes = await asyncio.gather(*(client(share, address) for share in shares))
+    seconds = time.perf_counter() - t
+    latencies = [x for lat, _ in outcomes for x in lat]
+    results = [None]*len(requests)
+    for i, (_, res) in enumerate(outcomes):
+        results[i::connections] = res
+    return latencies, results, seconds
+
+
+def direct(requests):
+    """Call jabz.py in this process, one color per call; (latencies, results)."""
+    latencies = []
+    results = []
+    for op, args in requests:
+        f = ops[op][1]
+        t = time.perf_counter()
+        results.append(f(*args))
+        latencies.append(time.perf_counter() - t)
+    return latencies, results
+
+
+def printLatencies(name, latencies, seconds):
+    p50, p99 = percentiles(latencies)
+    print(f'{name:24} {len(latencies)/seconds:12.0f} {p50*1e6:10.1f} {p99*1e6:10.1f}')
+
+
+async def runLoad(args):
+    address = (args.unix, args.host, args.port)
+    child = None
+    if args.unix is None and args.port is None:
+        # A server of our own, in its own process so that it does not share
+        # the client's event loop.
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'jabz.sock')
+        address = (path, args.host, 0)
+        child = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), 'serve', '--unix', path,
+            '--window-ms', str(args.window_ms), '--max-batch', str(args.max_batch), '--queue-size', str(args.queue_size),
+            stderr=asyncio.subprocess.PIPE)
+        if not (await child.stderr.readline()).startswith(b'serving on'):
+            raise RuntimeError(f'server exited with {await child.wait()}')
+
+    try:
+        requests = workload(args.requests)
+        latencies, results, seconds = await loadTest(requests, args.connections, address)
+        serverMetrics = await metrics(address)
+    finally:
+        if child:
+            child.terminate()
+            await child.wait()
+            if os.path.exists(path):
+                os.remove(path)
+            os.rmdir(directory)
+
+    jabz.jchzPalettes.clear()
+    t = time.perf_counter()
+    directLatencies, expected = direct(requests)
+    directSeconds = time.perf_counter() - t
+
+    print(f'{"":24} {"requests/s":>12} {"p50 us":>10} {"p99 us":>10}')
+    printLatencies(f'service ({args.connections} conns)', latencies, seconds)
+    printLatencies('direct jabz.py', directLatencies, directSeconds)
+    print(json.dumps(serverMetrics, indent=2))
+    mismatches = sum(r != e for r, e in zip(results, expected))
+    print(f'{mismatches} of {len(requests)} replies differ from jabz.py')
+    return mismatches
+
+
+async def checkServer():
+    """Replies to a poisoned and a valid request sent together on one connection."""
+    server, batcher = await startServer(window=0.05)
+    try:
+        reader, writer = await connect(None, *server.sockets[0].getsockname()[:2])
+        writer.write(b'{"id": 0, "op": "jchz", "args": [NaN, 0.3, 0.2]}\n{"id": 1, "op": "jchz", "args": [0.5, 0.3, 0.2]}\n')
+        await writer.drain()
+        replies = [json.loads(await reader.readline()) for _ in range(2)]
+        writer.close()
+        await writer.wait_closed()
+    finally:
+        server.close()
+        await batcher.stop()
+    return {reply['id']: reply for reply in replies}
+
+
+def check():
+    valid = [0.5, 0.3, 0.2]
+    for bad in (math.nan, math.inf, -math.inf):
+        assert parseRequest(json.dumps({'id': 0, 'op': 'jchz', 'args': [bad, 0.3, 0.2]}))[3], bad
+        assert parseRequest(json.dumps({'id': 0, 'op': 'jchzHash', 'args': [0.5, 0.3, 's', bad]}))[3], bad
+    assert parseRequest(json.dumps({'id': 0, 'op': 'jchz', 'args': valid}))[3] is None
+
+    # A batch that fails falls back to one request at a time.
+    with np.errstate(invalid='ignore'):
+        results = convert({'jchz': [[math.nan, 0.3, 0.2], valid]})['jchz']
+    assert isinstance(results[0], Exception), results
+    assert results[1] == jabz.jchz(*valid), results
+
+    replies = asyncio.run(checkServer())
+    assert 'error' in replies[0], replies
+    assert replies[1].get('result') == jabz.jchz(*valid), replies
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='service.py', description='Micro-batching jabz/jchz/jchzHash server and load test.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serveParser = commands.add_parser('serve', help='run the server')
+    loadParser = commands.add_parser('load', help='measure request latency against a server, or one in this process')
+    for p in (serveParser, loadParser):
+        p.add_argument('--unix', help='Unix socket path')
+        p.add_argument('--host', default='127.0.0.1', help='TCP host when --unix is not given (default: 127.0.0.1)')
+        p.add_argument('--port', type=int, help='TCP port when --unix is not given')
+        p.add_argument('--window-ms', type=float, default=2.0, help='longest wait for a batch to fill (default: 2)')
+        p.add_argument('--max-batch', type=int, default=4096, help='most requests in one batch (default: 4096)')
+        p.add_argument('--queue-size', type=int, default=16384, help='most queued requests before connections stop being read (default: 16384)')
+    loadParser.add_argument('--connections', type=int, default=64, help='concurrent client connections (default: 64)')
+    loadParser.add_argument('--requests', type=int, default=20000, help='total requests (default: 20000)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        if args.unix is None and args.port is None:
+            parser.error('serve needs --unix or --port')
+        try:
+            asyncio.run(serve(args.unix, args.host, args.port, window=args.window_ms/1e3, maxBatch=args.max_batch, queueSize=args.queue_size))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    return 1 if asyncio.run(runLoad(args)) else 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['check']:
+        check()
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -2,7 +2,10 @@ import jabz
 
 import math
 import decimal
+import dataclasses
+import time
 import typing
+import weakref
 
 from decimal import Decimal
 from dataclasses import dataclass
@@ -10,72 +13,130 @@ from dataclasses import dataclass
 decimal.getcontext().prec = 100
 
 
-@dataclass(frozen=True)
-class Expr:
+class Dialect(typing.NamedTuple):
+    prelude: str
+    where: typing.Callable[[str, str, str], str]
+    maximum: typing.Callable[[str, str], str]
+
+pythonDialect = Dialect(
+    '',
+    lambda c, x, y: f'({x} if {c} else {y})',
+    lambda x, y: f'max({x}, {y})',
+)
+
+numpyDialect = Dialect(
+    'import numpy as np\n',
+    lambda c, x, y: f'np.where({c}, {x}, {y})',
+    lambda x, y: f'np.maximum({x}, {y})',
+)
+
+
+internTable = weakref.WeakValueDictionary()
+
+class Interned(type):
+    """Hash-conses nodes: structurally equal nodes are the same object.
+
+    Equality and hashing are then by identity and O(1), and subtrees that
+    subs() copies into several places are shared, making every expression a
+    DAG rather than a tree.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        if kwargs:
+            args += tuple(kwargs[field.name] for field in dataclasses.fields(cls)[len(args):])
+        key = (cls, *args)
+        try:
+            return internTable[key]
+        except KeyError:
+            e = super().__call__(*args)
+            internTable[key] = e
+            return e
+
+@dataclass(frozen=True, eq=False)
+class Expr(metaclass=Interned):
+    """A node of the expression DAG.
+
+    Each pass method (expandMulAdd, evalConst, factorAddMul, subs) receives
+    the node's children already rewritten by that pass and returns the
+    rewritten node, or self when nothing changed. The Pass driver below does
+    the traversal.
+    """
+
     precedence = None
 
-    def bracketCode(self, e:'Expr'):
-        c = e.code()
+    def bracketCode(self, e:'Expr', dialect:Dialect=pythonDialect):
+        c = e.code(dialect)
         if e.precedence > self.precedence:
             return f'({c})'
         return c
 
-    def opCode(self, sep:str, x:'Expr', y:'Expr'):
-        xc = self.bracketCode(x)
-        yc = self.bracketCode(y)
+    def opCode(self, sep:str, x:'Expr', y:'Expr', dialect:Dialect=pythonDialect):
+        xc = self.bracketCode(x, dialect)
+        yc = self.bracketCode(y, dialect)
         return f'{xc}{sep}{yc}'
 
-    def factorAddMul(self, factors):
-        return self, False
+    def children(self):
+        return ()
+
+    def factorChildren(self):
+        return ()
+
+    def rebuild(self, cs):
+        if all(c is o for c, o in zip(cs, self.children())):
+            return self
+        return type(self)(*cs)
 
     def multiplicands(self):
-        yield self
+        stack = [self]
+        while stack:
+            e = stack.pop()
+            if type(e) is Mul:
+                stack += (e.y, e.x)
+            elif type(e) is Neg:
+                yield negOne
+                yield e.e
+            else:
+                yield e
 
     def addends(self):
-        yield self
+        stack = [self]
+        while stack:
+            e = stack.pop()
+            if type(e) is Add:
+                stack += (e.y, e.x)
+            else:
+                yield e
 
-    def subs(self, s):
-        try:
-            return s[self], True
-        except KeyError:
-            return self._subs(s)
+    def expandMulAdd(self, *cs):
+        return self.rebuild(cs)
+
+    def evalConst(self, *cs):
+        return self.rebuild(cs)
+
+    def factorAddMul(self, index, *cs):
+        return self.rebuild(cs)
+
+    def subs(self, *cs):
+        return self.rebuild(cs)
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Var(Expr):
     symbol: str
 
     precedence = 0
 
-    def code(self):
+    def code(self, dialect:Dialect=pythonDialect):
         return self.symbol
 
-    def expandMulAdd(self):
-        return (self, False)
-
-    def evalConst(self):
-        return (self, False)
-
-    def _subs(self, s):
-        return (self, False)
-
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Num(Expr):
     value: Decimal
 
     precedence = Var.precedence
 
-    def code(self):
+    def code(self, dialect:Dialect=pythonDialect):
         return f'{self.value:0.19g}'
 
-    def expandMulAdd(self):
-        return (self, False)
-
-    def evalConst(self):
-        return (self, False)
-
-    def _subs(self, s):
-        return (self, False)
-
 def num(text):
     return Num(Decimal(text))
 
@@ -83,69 +144,46 @@ zero = num('0')
 one = num('1')
 negOne = num('-1')
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Inv(Expr):
     e: Expr
 
     precedence = Var.precedence + 1
 
-    def code(self):
-        return self.opCode('/', one, self.e)
+    def code(self, dialect:Dialect=pythonDialect):
+        return self.opCode('/', one, self.e, dialect)
+
+    def children(self):
+        return (self.e,)
 
-    def evalConst(self):
-        e, ec = self.e.evalConst()
+    def evalConst(self, e):
         if isinstance(e, Num):
-            return Num(one.value/e.value), True
-        if ec:
-            return Inv(e), True
-        return self, False
-
-    def _subs(self, s):
-        e, ec = self.e.subs(s)
-        if ec:
-            return Inv(e), True
-        return self, False
-
-    def expandMulAdd(self):
-        e, ec = self.e.expandMulAdd()
-        if ec:
-            return Inv(e), True
-        return self, False
-
-@dataclass(frozen=True)
+            return Num(one.value/e.value)
+        return self.rebuild((e,))
+
+@dataclass(frozen=True, eq=False)
 class Neg(Expr):
     e: Expr
 
     precedence = Inv.precedence
 
-    def code(self):
-        return f'-{self.bracketCode(self.e)}'
+    def code(self, dialect:Dialect=pythonDialect):
+        return f'-{self.bracketCode(self.e, dialect)}'
 
-    def evalConst(self):
-        e, ec = self.e.evalConst()
+    def children(self):
+        return (self.e,)
+
+    def evalConst(self, e):
         if isinstance(e, Num):
-            return Num(-e.value), True
-        if ec:
-            return Neg(e), True
-        return self, False
-
-    def _subs(self, s):
-        e, ec = self.e.subs(s)
-        if ec:
-            return Neg(e), True
-        return self, False
-
-    def expandMulAdd(self):
-        e, ec = Mul(negOne, self.e).expandMulAdd()
-        if ec:
-            return e, True
-        return self, False
+            return Num(-e.value)
+        return self.rebuild((e,))
 
-    def multiplicands(self):
-        yield negOne
-        yield self.e
+    def expandMulAdd(self, e):
+        m = Mul(negOne, self.e)
+        r = m.expandMulAdd(negOne, e)
+        return self if r is m else r
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Mul(Expr):
     x: Expr
     y: Expr
@@ -162,34 +200,32 @@ class Mul(Expr):
             return x
         return cls(x, y)
 
-    def code(self):
-        return self.opCode('*', self.x, self.y)
+    def code(self, dialect:Dialect=pythonDialect):
+        if isinstance(self.y, Inv):
+            d = self.y.e.code(dialect)
+            if self.y.e.precedence > Var.precedence:
+                d = f'({d})'
+            return f'{self.bracketCode(self.x, dialect)}/{d}'
+        return self.opCode('*', self.x, self.y, dialect)
 
-    def multiplicands(self):
-        yield from self.x.multiplicands()
-        yield from self.y.multiplicands()
-
-    def expandMulAdd(self):
-        x, xc = self.x.expandMulAdd()
-        y, yc = self.y.expandMulAdd()
-        changed = xc or yc
-        if isinstance(x, Add):
-            return Add(expandMulAdd(Mul(x.x, y)), expandMulAdd(Mul(x.y, y))), True
-        elif isinstance(y, Add):
-            return Add(expandMulAdd(Mul(x, y.x)), expandMulAdd(Mul(x, y.y))), True
-        else:
-            return (Mul.simplifyZeroOne(x, y) if changed else self, changed)
-
-    def factorAddMul(self, factors):
-        x, xc = self.x.factorAddMul(factors)
-        y, yc = self.y.factorAddMul(factors)
-        if xc or yc:
-            return Mul.simplifyZeroOne(x, y), True
-        return self, False
-
-    def evalConst(self):
-        x, xc = self.x.evalConst()
-        y, yc = self.y.evalConst()
+    def children(self):
+        return (self.x, self.y)
+
+    factorChildren = children
+
+    def expandMulAdd(self, x, y):
+        if isinstance(x, Add) or isinstance(y, Add):
+            return adds(Mul(a, b) for a in x.addends() for b in y.addends())
+        if x is self.x and y is self.y:
+            return self
+        return Mul.simplifyZeroOne(x, y)
+
+    def factorAddMul(self, index, x, y):
+        if x is self.x and y is self.y:
+            return self
+        return Mul.simplifyZeroOne(x, y)
+
+    def evalConst(self, x, y):
         e = one
         n = one
         for m in (*x.multiplicands(), *y.multiplicands()):
@@ -198,18 +234,10 @@ class Mul(Expr):
             else:
                 e = Mul.simplifyZeroOne(e, m)
 
-        r = Mul.simplifyZeroOne(e, n)
-        return r, r != self
-
-    def _subs(self, s):
-        x, xc = self.x.subs(s)
-        y, yc = self.y.subs(s)
-        if xc or yc:
-            return Mul(x, y), True
-        return self, False
+        return Mul.simplifyZeroOne(e, n)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Add(Expr):
     x: Expr
     y: Expr
@@ -224,63 +252,197 @@ class Add(Expr):
             return x
         return cls(x, y)
 
-    def code(self):
-        return self.opCode(' + ', self.x, self.y)
+    def code(self, dialect:Dialect=pythonDialect):
+        return ' + '.join(self.bracketCode(e, dialect) for e in self.addends())
 
-    def addends(self):
-        yield from self.x.addends()
-        yield from self.y.addends()
+    def children(self):
+        # Passes see a chain of Adds as one n-ary node, so a long sum is
+        # flattened once rather than once per link.
+        return tuple(self.addends())
 
-    def expandMulAdd(self):
-        x, xc = self.x.expandMulAdd()
-        y, yc = self.y.expandMulAdd()
-        changed = xc or yc
-        return (Add.simplifyZero(x, y) if changed else self, changed)
+    factorChildren = children
 
-    def factorAddMul(self, factors):
-        x, xc = self.x.factorAddMul(factors)
-        y, yc = self.y.factorAddMul(factors)
+    def rebuild(self, cs):
+        if all(c is o for c, o in zip(cs, self.children())):
+            return self
+        return adds(c for c in cs if c != zero)
 
+    def factorAddMul(self, index, *cs):
+        factors = list(index)
         factorGroups = {}
-        for addend in [*x.addends(), *y.addends()]:
-            d = {e:i for i, e in enumerate(factors)}
+        for addend in (a for c in cs for a in c.addends()):
+            taken = set()
             fm = []
             ms = []
             for multiplicand in addend.multiplicands():
-                try:
-                    i = d.pop(multiplicand)
-                    fm.append(i)
-                except KeyError:
+                i = index.get(multiplicand)
+                if i is None or i in taken:
                     ms.append(multiplicand)
+                else:
+                    taken.add(i)
+                    fm.append(i)
 
             fm = tuple(sorted(fm))
             if fm not in factorGroups:
                 factorGroups[fm] = []
             factorGroups[fm].append(ms)
 
-        result = adds(muls([*(factors[i] for i in fm), adds(muls(g) for g in group)]) for fm, group in factorGroups.items())
-        return result, result != self
+        return adds(muls([*(factors[i] for i in fm), adds(muls(g) for g in group)]) for fm, group in factorGroups.items())
 
-    def evalConst(self):
-        x, xc = self.x.evalConst()
-        y, yc = self.y.evalConst()
+    def evalConst(self, *cs):
         e = zero
         n = zero
-        for m in (*x.addends(), *y.addends()):
+        for m in (a for c in cs for a in c.addends()):
             if isinstance(m, Num):
                 n = Num(n.value + m.value)
             else:
                 e = Add.simplifyZero(e, m)
 
-        r = Add.simplifyZero(e, n)
-        return r, r != self
+        return Add.simplifyZero(e, n)
 
-    def _subs(self, s):
-        x, xc = self.x.subs(s)
-        y, yc = self.y.subs(s)
-        if xc or yc:
-            return Add.simplifyZero(x, y), True
-        return self, False
+
+@dataclass(frozen=True, eq=False)
+class Fn(Expr):
+    """Base for nodes the passes only recurse through, without distributing or factoring."""
+
+    precedence = Var.precedence
+
+    def factorChildren(self):
+        return self.children()
+
+    def fold(self):
+        return self
+
+    def evalConst(self, *cs):
+        return self.rebuild(cs).fold()
+
+@dataclass(frozen=True, eq=False)
+class Pow(Fn):
+    x: Expr
+    y: Expr
+
+    precedence = Inv.precedence
+
+    def code(self, dialect:Dialect=pythonDialect):
+        x = self.x.code(dialect)
+        if self.x.precedence > Var.precedence or (isinstance(self.x, Num) and self.x.value < 0):
+            x = f'({x})'
+        return f'{x}**{self.bracketCode(self.y, dialect)}'
+
+    def children(self):
+        return (self.x, self.y)
+
+    def fold(self):
+        if isinstance(self.x, Num) and isinstance(self.y, Num):
+            return Num(self.x.value ** self.y.value)
+        if self.y == one:
+            return self.x
+        return self
+
+@dataclass(frozen=True, eq=False)
+class Le(Fn):
+    x: Expr
+    y: Expr
+
+    precedence = Add.precedence + 1
+
+    def code(self, dialect:Dialect=pythonDialect):
+        return self.opCode(' <= ', self.x, self.y, dialect)
+
+    def children(self):
+        return (self.x, self.y)
+
+@dataclass(frozen=True, eq=False)
+class Where(Fn):
+    c: Le
+    x: Expr
+    y: Expr
+
+    def code(self, dialect:Dialect=pythonDialect):
+        return dialect.where(self.c.code(dialect), self.x.code(dialect), self.y.code(dialect))
+
+    def children(self):
+        return (self.c, self.x, self.y)
+
+@dataclass(frozen=True, eq=False)
+class Max(Fn):
+    x: Expr
+    y: Expr
+
+    def code(self, dialect:Dialect=pythonDialect):
+        return dialect.maximum(self.x.code(dialect), self.y.code(dialect))
+
+    def children(self):
+        return (self.x, self.y)
+
+    def fold(self):
+        if isinstance(self.x, Num) and isinstance(self.y, Num):
+            return Num(max(self.x.value, self.y.value))
+        return self
+
+
+class Pass:
+    """A bottom-up rewrite run with an explicit stack, so deep chains don't hit the recursion limit.
+
+    Nodes are interned, so results are memoized on the node itself and each
+    distinct subexpression is rewritten once however often it is shared or
+    however many times the pass is run over overlapping expressions.
+    """
+
+    def __init__(self, name, rewrite, children=lambda e: e.children()):
+        self.name = name
+        self.rewrite = rewrite
+        self.children = children
+        self.memos = {}
+        self.runs = 0
+        self.rewrites = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def __call__(self, root, *context, memo=None):
+        start = time.perf_counter()
+        if memo is None:
+            memo = self.memos.setdefault(context, {})
+        if root in memo:
+            self.hits += 1
+        stack = [root]
+        while stack:
+            e = stack[-1]
+            if e in memo:
+                stack.pop()
+                continue
+            cs = self.children(e, *context)
+            pending = [c for c in cs if c not in memo]
+            if pending:
+                stack += pending
+                continue
+            stack.pop()
+            self.hits += len(cs)
+            memo[e] = self.rewrite(e, [memo[c] for c in cs], *context)
+            self.rewrites += 1
+        self.runs += 1
+        self.seconds += time.perf_counter() - start
+        return memo[root]
+
+    def clear(self):
+        self.memos.clear()
+
+def subsChildren(e, s):
+    return () if e in s else e.children()
+
+def subsRewrite(e, cs, s):
+    return s[e] if e in s else e.subs(*cs)
+
+expandMulAddPass = Pass('expandMulAdd', lambda e, cs: e.expandMulAdd(*cs))
+evalConstPass = Pass('evalConst', lambda e, cs: e.evalConst(*cs))
+factorAddMulPass = Pass('factorAddMul', lambda e, cs, index: e.factorAddMul(index, *cs), lambda e, index: e.factorChildren())
+subsPass = Pass('subs', subsRewrite, subsChildren)
+treeSizePass = Pass('treeSize', lambda e, cs: 1 + sum(cs))
+passes = [expandMulAddPass, evalConstPass, factorAddMulPass, subsPass, treeSizePass]
+
+def passReport():
+    for p in passes:
+        print(f'{p.name:>12}: {p.runs:5} runs {p.rewrites:7} rewrites {p.hits:7} memo hits {p.seconds*1000:8.1f} ms')
 
 
 def vars(symbols):
@@ -319,12 +481,12 @@ def muls(xs):
     return result
 
 def expandMulAdd(e:Expr):
-    r, changed = e.expandMulAdd()
-    return r
+    return expandMulAddPass(e)
 
 def factorAddMul(factors, e:Expr):
-    r, changed = e.factorAddMul(factors)
-    return r
+    factors = tuple(factors)
+    memo = factorAddMulPass.memos.setdefault(factors, {})
+    return factorAddMulPass(e, {f:i for i, f in enumerate(factors)}, memo=memo)
 
 def vecMatMul(vec, mat):
     return [dot(m, vec) for m in mat]
@@ -336,12 +498,10 @@ def vecMatsMul(vec, *mats):
     return v
 
 def evalConst(e:Expr):
-    r, changed = e.evalConst()
-    return r
+    return evalConstPass(e)
 
 def subs(s:typing.Dict[Expr, Expr], e:Expr):
-    r, changed = e.subs(s)
-    return r
+    return subsPass(e, s, memo={})
 
 r, g, b, x, y, z = vars('t3.r t3.g t3.b x y z')
 values = {
@@ -395,15 +555,16 @@ mkValue(Var('bz'), adds([Mul(num('0.199076'), Var('l_')), Mul(num('1.096799'), V
 mkValue(Var('d'), num('-0.56'))
 mkValue(Var('d0'), num('1.6295499532821566e-11'))
 
-exprs = [
-    Var('iz'),
-    Mul(Var('iz'), num('0.44')),
-    Add(Mul(Var('iz'), num('-0.56')), one),
-    Var('az'),
-    Var('bz'),
-]
-for expr in exprs:
-    print(expr.code(), '=', evalConst(factorAddMul(vars('t3.r t3.g t3.b'), expandMulAdd(subs(values, expr)))).code())
+def printFolded():
+    exprs = [
+        Var('iz'),
+        Mul(Var('iz'), num('0.44')),
+        Add(Mul(Var('iz'), num('-0.56')), one),
+        Var('az'),
+        Var('bz'),
+    ]
+    for expr in exprs:
+        print(expr.code(), '=', evalConst(factorAddMul(vars('t3.r t3.g t3.b'), expandMulAdd(subs(values, expr)))).code())
 
 
 def c_linear(c):
@@ -488,12 +649,299 @@ def check(r, g, b):
     print(f'{r:0<2x},{g:0<2x},{b:0<2x} {s1} {s2}')
 
 
-#check(0, 0, 0)
-check(0, 0, 255)
-check(0, 255, 0)
-check(0, 255, 255)
-check(255, 0, 0)
-check(255, 0, 255)
-check(255, 255, 0)
-check(255, 255, 255)
-check(1, 2, 3)
+
+class Kernel(typing.NamedTuple):
+    name: str
+    params: typing.List[str]
+    steps: typing.List[typing.Tuple[str, Expr]]
+    results: typing.List[str]
+
+def fold(e:Expr, factors=()):
+    return evalConst(factorAddMul(list(factors), expandMulAdd(e)))
+
+def const(name):
+    return values[Var(name)]
+
+class KernelBuilder:
+    def __init__(self):
+        self.steps = []
+
+    def step(self, name, e:Expr, factors=()):
+        self.steps.append((name, fold(e, factors)))
+        return Var(name)
+
+    def kernel(self, name, params, results):
+        return Kernel(name, params.split(), self.steps, results.split())
+
+def forwardKernel():
+    k = KernelBuilder()
+    linear = {}
+    for c, sc in zip('rgb', vars('sr sg sb')):
+        srgb1 = Mul(sc, Inv(num('255')))
+        linear[Var(f't3.{c}')] = k.step(c, Where(
+            Le(sc, Mul(num('0.04045'), num('255'))),
+            Mul(srgb1, Inv(num('12.92'))),
+            Pow(Mul(Add(srgb1, num('0.055')), Inv(num('1.055'))), num('2.4')),
+        ))
+
+    for c in 'lms':
+        k.step(f'{c}1', subs(linear, const(f'{c}__')), linear.values())
+
+    for c in 'lms':
+        x2 = k.step(f'{c}2', Pow(Var(f'{c}1'), const('n')))
+        x3 = k.step(f'{c}3', Add(Mul(x2, const('c2')), const('c1')))
+        x4 = k.step(f'{c}4', Add(Mul(x2, const('c3')), one))
+        k.step(f'{c}_', Pow(Mul(x3, Inv(x4)), const('p')))
+
+    lms = vars('l_ m_ s_')
+    iz = k.step('iz', const('iz'), lms)
+    jz1 = k.step('jz1', Mul(iz, Add(one, const('d'))), [iz])
+    jz2 = k.step('jz2', Add(Mul(iz, const('d')), one))
+    k.step('jz', Add(Mul(jz1, Inv(jz2)), Neg(const('d0'))))
+    k.step('az', const('az'), lms)
+    k.step('bz', const('bz'), lms)
+    return k.kernel('srgb255ToJzAzBz', 'sr sg sb', 'jz az bz')
+
+IAB_LMS = [
+    [one, num(float.fromhex('0x1.1bdcf5ff4b9ffp-3')), num(float.fromhex('0x1.db860b905af44p-5'))],
+    [one, num(float.fromhex('-0x1.1bdcf5ff4b9fep-3')), num(float.fromhex('-0x1.db860b905af4fp-5'))],
+    [one, num(float.fromhex('-0x1.894b7904a2cf8p-4')), num(float.fromhex('-0x1.9fb04b6ae56fdp-1'))],
+]
+
+LMS_XYZ = [
+    [num(float.fromhex('0x1.ec9a1a8bce714p+0')), num(float.fromhex('-0x1.013a11a9de8acp+0')), num(float.fromhex('0x1.3470b79eb8366p-5'))],
+    [num(float.fromhex('0x1.66b96ff1c1292p-2')), num(float.fromhex('0x1.73f557d230e47p-1')), num(float.fromhex('-0x1.0bd08963ad7e9p-4'))],
+    [num(float.fromhex('-0x1.74aa645ab6306p-4')), num(float.fromhex('-0x1.403bd8515285fp-2')), num(float.fromhex('0x1.85d407843f9bep+0'))],
+]
+
+def inverseLms(k):
+    """Steps from jz az bz to the linear l5 m5 s5 cone responses (scaled by 1/10000)."""
+    jz, az, bz = vars('jz az bz')
+    iz0 = k.step('iz0', Add(jz, const('d0')))
+    iz = k.step('iz', Mul(iz0, Inv(Add(Mul(iz0, Neg(const('d'))), Add(one, const('d'))))))
+
+    for c, row in zip('lms', IAB_LMS):
+        k.step(f'{c}_', dot(row, [iz, az, bz]))
+
+    for c in 'lms':
+        x1 = k.step(f'{c}1', Pow(Max(Var(f'{c}_'), zero), Inv(const('p'))))
+        x2 = k.step(f'{c}2', Add(const('c1'), Neg(x1)))
+        x3 = k.step(f'{c}3', Add(Mul(const('c3'), x1), Neg(const('c2'))))
+        x4 = k.step(f'{c}4', Max(Mul(x2, Inv(x3)), zero))
+        k.step(f'{c}5', Pow(x4, Inv(const('n'))))
+
+    return [Mul(num('10000'), Var(f'{c}5')) for c in 'lms']
+
+def inverseXyz100(lms):
+    x_, y_, z_ = (dot(row, lms) for row in LMS_XYZ)
+    x = Mul(Add(x_, Mul(Add(const('b'), Neg(one)), z_)), Inv(const('b')))
+    y = Mul(Add(y_, Mul(Add(const('g'), Neg(one)), x)), Inv(const('g')))
+    return x, y, z_
+
+def inverseKernel():
+    k = KernelBuilder()
+    for name, e in zip('xyz', inverseXyz100(inverseLms(k))):
+        k.step(name, e, vars('l5 m5 s5'))
+    return k.kernel('jzazbzToXyz100', 'jz az bz', 'x y z')
+
+XYZ1_RGB1 = [
+    [num('3.2406255'), num('-1.537208'), num('-0.4986286')],
+    [num('-0.9689307'), num('1.8757561'), num('0.0415175')],
+    [num('0.0557101'), num('-0.2040211'), num('1.0569959')],
+]
+
+def inverseSrgbKernel():
+    """JzAzBz -> sRGB255, with LMS -> XYZ' -> XYZ -> linear RGB folded into one matrix."""
+    k = KernelBuilder()
+    xyz1 = [Mul(e, Inv(num('100'))) for e in inverseXyz100(inverseLms(k))]
+    cut = num(float.fromhex('0x1.9a5c61c57a062p-9'))
+    for c, row in zip('rgb', XYZ1_RGB1):
+        linear = k.step(f'{c}1', dot(row, xyz1), vars('l5 m5 s5'))
+        k.step(c, Where(
+            Le(linear, cut),
+            Mul(Mul(linear, num('12.92')), num('255')),
+            Mul(Add(Mul(num('1.055'), Pow(Max(linear, cut), Inv(num('2.4')))), num('-0.055')), num('255')),
+        ))
+    return k.kernel('jzazbzToSrgb255', 'jz az bz', 'r g b')
+
+def treeSize(roots):
+    """Node count if every shared subtree were copied out, as a plain tree."""
+    return sum(treeSizePass(e) for e in roots)
+
+def dagSize(roots):
+    seen = set()
+    stack = list(roots)
+    while stack:
+        e = stack.pop()
+        if e not in seen:
+            seen.add(e)
+            stack.extend(e.children())
+    return len(seen)
+
+def inline(kernel:Kernel):
+    defs = {}
+    names = {}
+    for name, e in kernel.steps:
+        defs[Var(name)] = subs(defs, e)
+        names[defs[Var(name)]] = name
+    return [defs[Var(r)] for r in kernel.results], names
+
+def cse(kernel:Kernel):
+    """Rebuild the kernel from its fully inlined outputs, naming each shared subexpression once.
+
+    Temporaries keep the name of the step they came from where there is one.
+    Single-use steps are inlined into their user. Nothing is hoisted out of a
+    Where branch unless it is also needed unconditionally, so the scalar
+    dialect still only evaluates the branch it takes.
+    """
+    roots, names = inline(kernel)
+    names.update(zip(roots, kernel.results))
+
+    refs = {}
+    order = []
+    branches = []
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        e, visited = stack.pop()
+        if visited:
+            order.append(e)
+            continue
+        refs[e] = refs.get(e, 0) + 1
+        if refs[e] == 1:
+            stack.append((e, True))
+            if isinstance(e, Where):
+                branches += (e.x, e.y)
+                stack.append((e.c, False))
+            else:
+                stack += ((c, False) for c in reversed(e.children()))
+
+    unconditional = set(order)
+    seen = set()
+    while branches:
+        e = branches.pop()
+        refs[e] = refs.get(e, 0) + 1
+        if e not in unconditional and e not in seen:
+            seen.add(e)
+            branches += e.children()
+
+    shared = {e for e in order if refs[e] > 1 and not isinstance(e, (Var, Num))}
+    shared.update(roots)
+
+    temps = {}
+    steps = []
+    for e in order:
+        if e in shared:
+            name = names.get(e) or f't{len(temps)}'
+            steps.append((name, e.subs(*(subs(temps, c) for c in e.children()))))
+            temps[e] = Var(name)
+
+    print(f'{kernel.name}: {treeSize(roots)} tree nodes -> {dagSize(roots)} DAG nodes, {len(kernel.steps)} -> {len(steps)} steps')
+    return Kernel(kernel.name, kernel.params, steps, kernel.results)
+
+def kernels():
+    return [cse(forwardKernel()), cse(inverseKernel()), cse(inverseSrgbKernel())]
+
+
+def kernelCode(kernel:Kernel, dialect:Dialect):
+    lines = [f'def {kernel.name}({", ".join(kernel.params)}):']
+    lines += [f'    {name} = {e.code(dialect)}' for name, e in kernel.steps]
+    lines.append(f'    return {", ".join(kernel.results)}')
+    return '\n'.join(lines) + '\n'
+
+def moduleCode(kernels, dialect:Dialect):
+    header = '# Generated by srgb255ToJzAzBz.py from the folded jabz.py conversion; do not edit.\n'
+    if dialect.prelude:
+        header += '\n' + dialect.prelude
+    return header + ''.join(f'\n\n{kernelCode(kernel, dialect)}' for kernel in kernels)
+
+modules = [
+    ('jabzfast.py', pythonDialect),
+    ('jabzfastnp.py', numpyDialect),
+]
+
+def writeModules(directory=None):
+    import os
+
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    ks = kernels()
+    for filename, dialect in modules:
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write(moduleCode(ks, dialect))
+
+
+def sampleColors(n=4096, seed=0):
+    import random
+
+    rnd = random.Random(seed)
+    return [jabz.SRGB255(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)) for i in range(n)]
+
+def checkModules():
+    import importlib
+    import numpy as np
+    import jabzfast
+    import jabzfastnp
+
+    importlib.reload(jabzfast)
+    importlib.reload(jabzfastnp)
+
+    colors = sampleColors()
+    forward = [c.jzazbz() for c in colors]
+    inverse = [c.xyz100() for c in forward]
+    roundTrip = [c.xyz1().rgb1().srgb1().srgb255() for c in inverse]
+    srgb = np.array(colors, dtype=np.float64).T
+    jzazbz = np.array(forward).T
+
+    def maxDiff(actual, expected):
+        return max(abs(a - e) for xs, ys in zip(actual, expected) for a, e in zip(xs, ys))
+
+    print('srgb255ToJzAzBz max diff:',
+        maxDiff([jabzfast.srgb255ToJzAzBz(*c) for c in colors], forward),
+        maxDiff(np.array(jabzfastnp.srgb255ToJzAzBz(*srgb)).T.tolist(), forward))
+    print('jzazbzToXyz100 max diff:',
+        maxDiff([jabzfast.jzazbzToXyz100(*c) for c in forward], inverse),
+        maxDiff(np.array(jabzfastnp.jzazbzToXyz100(*jzazbz)).T.tolist(), inverse))
+    print('jzazbzToSrgb255 max diff:',
+        maxDiff([jabzfast.jzazbzToSrgb255(*c) for c in forward], roundTrip),
+        maxDiff(np.array(jabzfastnp.jzazbzToSrgb255(*jzazbz)).T.tolist(), roundTrip))
+
+def bench(n=20000):
+    import timeit
+    import numpy as np
+    import jabzfast
+    import jabzfastnp
+
+    colors = sampleColors(n)
+    forward = [c.jzazbz() for c in colors]
+    srgb = np.array(colors, dtype=np.float64).T
+    jzazbz = np.array(forward).T
+
+    cases = [
+        ('forward', 'SRGB255.jzazbz', lambda: [c.jzazbz() for c in colors]),
+        ('forward', 'srgb255ToJzAzBz (hand-folded)', lambda: [srgb255ToJzAzBz(*c) for c in colors]),
+        ('forward', 'jabzfast.srgb255ToJzAzBz', lambda: [jabzfast.srgb255ToJzAzBz(*c) for c in colors]),
+        ('forward', 'jabzfastnp.srgb255ToJzAzBz', lambda: jabzfastnp.srgb255ToJzAzBz(*srgb)),
+        ('xyz100', 'JzAzBz.xyz100', lambda: [c.xyz100() for c in forward]),
+        ('xyz100', 'jabzfast.jzazbzToXyz100', lambda: [jabzfast.jzazbzToXyz100(*c) for c in forward]),
+        ('xyz100', 'jabzfastnp.jzazbzToXyz100', lambda: jabzfastnp.jzazbzToXyz100(*jzazbz)),
+        ('srgb255', 'JzAzBz...srgb255 chain', lambda: [c.xyz100().xyz1().rgb1().srgb1().srgb255() for c in forward]),
+        ('srgb255', 'jabzfast.jzazbzToSrgb255', lambda: [jabzfast.jzazbzToSrgb255(*c) for c in forward]),
+        ('srgb255', 'jabzfastnp.jzazbzToSrgb255', lambda: jabzfastnp.jzazbzToSrgb255(*jzazbz)),
+    ]
+    baseline = {}
+    for group, name, f in cases:
+        t = min(timeit.repeat(f, number=1, repeat=3))
+        baseline.setdefault(group, t)
+        print(f'{name:32} {n/t/1e6:8.3f} Mpixel/s {baseline[group]/t:8.1f}x')
+
+
+if __name__ == '__main__':
+    import sys
+
+    printFolded()
+    for c in [(0, 0, 255), (0, 255, 0), (0, 255, 255), (255, 0, 0), (255, 0, 255), (255, 255, 0), (255, 255, 255), (1, 2, 3)]:
+        check(*c)
+    writeModules()
+    passReport()
+    checkModules()
+    if 'bench' in sys.argv[1:]:
+        bench()
@@ -0,0 +1,202 @@
+"""Sweep all 2**24 sRGB255 colors for exact JzAzBz/JzCzHz statistics.
+
+The exhaustive counterpart of jabz.findJabBounds and jabz.findJchBounds. The
+cube is split by red plane: each task converts its 256 x 256 colors in one
+jabznp batch and reduces them to a small summary, which is merged into the
+running total as soon as it arrives. A summary holds:
+
+  - min and max of jz, az, bz, cz and hz, with the sRGB255 color that hits each,
+  - max cz in each of --hue-bins equal hue bins, with its color,
+  - histograms of jz and of hz.
+
+The jz, az, bz and cz extremes give jabz.py's A2 constants in .hex() form.
+
+    python3 sweep.py --workers 8
+    python3 sweep.py --hue-bins 72 --json sweep.json
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import bounds
+import jabznp
+
+
+PLANE = 1 << 16
+JZ_BINS = 256
+JZ_RANGE = (0.0, 0.17)
+CHANNELS = ('jz', 'az', 'bz', 'cz', 'hz')
+
+
+def plane(r):
+    """The 256 x 256 sRGB255 colors with red r, blue varying fastest."""
+    i = np.arange(PLANE)
+    return np.stack([np.full(PLANE, r), i >> 8, i & 0xFF], axis=-1)
+
+
+def colorIndex(srgb):
+    return (srgb[..., 0] << 16) | (srgb[..., 1] << 8) | srgb[..., 2]
+
+
+def indexColor(i):
+    return (i >> 16, (i >> 8) & 0xFF, i & 0xFF)
+
+
+def hueBin(hz, hueBins):
+    return np.minimum(((hz + math.pi)/math.tau*hueBins).astype(np.int64), hueBins - 1)
+
+
+def sweepPlane(r, hueBins=360, accuracy='exact'):
+    """The summary of red plane r."""
+    return summarize(plane(r), hueBins, accuracy)
+
+
+def summarize(srgb, hueBins=360, accuracy='exact'):
+    """The summary of an (N, 3) array of sRGB255 colors."""
+    index = colorIndex(srgb)
+    jzazbz = jabznp.srgb255_to_jzazbz(srgb, accuracy)
+    jzczhz = jabznp.jzazbz_to_jzczhz(jzazbz)
+    values = dict(zip(CHANNELS, (*jabznp.components(jzazbz), *jabznp.components(jzczhz)[1:])))
+
+    summary = {}
+    for name, v in values.items():
+        lo, hi = v.argmin(), v.argmax()
+        summary[name] = [float(v[lo]), int(index[lo]), float(v[hi]), int(index[hi])]
+
+    # The last color of each bin, ordered by (bin, cz), has the bin's max cz.
+    # Grays have no hue and are left out. Their cz is float noise rather than
+    # 0, so they are found by r == g == b instead.
+    cz, hz = values['cz'], values['hz']
+    chromatic = np.flatnonzero((srgb[:, 0] != srgb[:, 1]) | (srgb[:, 1] != srgb[:, 2]))
+    bins = hueBin(hz[chromatic], hueBins)
+    order = np.lexsort((cz[chromatic], bins))
+    ends = np.flatnonzero(np.diff(bins[order], append=hueBins))
+    winners = chromatic[order[ends]]
+    hueMax = np.zeros(hueBins)
+    hueWitness = np.full(hueBins, -1, dtype=np.int64)
+    hueMax[bins[order[ends]]] = cz[winners]
+    hueWitness[bins[order[ends]]] = index[winners]
+
+    summary['hue_max_cz'] = hueMax
+    summary['hue_witness'] = hueWitness
+    summary['jz_histogram'] = np.histogram(values['jz'], JZ_BINS, JZ_RANGE)[0]
+    summary['hue_histogram'] = np.bincount(bins, minlength=hueBins)
+    summary['count'] = len(srgb)
+    return summary
+
+
+def merge(total, summary):
+    """Fold one plane's summary into the running total; the first summary becomes the total."""
+    if not total:
+        total.update(summary)
+        return
+    for name in CHANNELS:
+        t, s = total[name], summary[name]
+        if s[0] < t[0]:
+            t[0:2] = s[0:2]
+        if s[2] > t[2]:
+            t[2:4] = s[2:4]
+    better = summary['hue_max_cz'] > total['hue_max_cz']
+    total['hue_max_cz'] = np.where(better, summary['hue_max_cz'], total['hue_max_cz'])
+    total['hue_witness'] = np.where(better, summary['hue_witness'], total['hue_witness'])
+    for key in ('jz_histogram', 'hue_histogram', 'count'):
+        total[key] = total[key] + summary[key]
+
+
+def sweep(hueBins=360, accuracy='exact', workers=None, progress=None):
+    """The merged summary of every red plane, computed across worker processes."""
+    if accuracy == 'lut':
+        # Build the shared table once here rather than racing in every worker.
+        import jabzlut
+        jabzlut.lut()
+    total = {}
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(sweepPlane, r, hueBins, accuracy) for r in range(256)]
+        for done, future in enumerate(as_completed(futures), 1):
+            merge(total, future.result())
+            if progress:
+                progress(done)
+    return total
+
+
+def constants(total):
+    """jabz.py's constants from the swept extremes, formatted as bounds.constants does."""
+    extremes = {}
+    for name in ('jz', 'az', 'bz', 'cz'):
+        lo, loIndex, hi, hiIndex = total[name]
+        extremes[name + '0'] = (lo, lo, indexColor(loIndex))
+        extremes[name + '1'] = (hi, hi, indexColor(hiIndex))
+    return bounds.constants(extremes)
+
+
+def report(total):
+    """The merged summary as plain JSON-ready values."""
+    extremes = {}
+    for name in CHANNELS:
+        lo, loIndex, hi, hiIndex = total[name]
+        extremes[name] = {'min': lo, 'min_srgb255': indexColor(loIndex), 'max': hi, 'max_srgb255': indexColor(hiIndex)}
+    return {
+        'count': int(total['count']),
+        'extremes': extremes,
+        'hue_max_cz': total['hue_max_cz'].tolist(),
+        'hue_max_srgb255': [indexColor(i) if i >= 0 else None for i in total['hue_witness'].tolist()],
+        'jz_histogram': {'range': JZ_RANGE, 'counts': total['jz_histogram'].tolist()},
+        'hue_histogram': total['hue_histogram'].tolist(),
+        'constants': constants(total),
+    }
+
+
+def check(hueBins=360):
+    greys = np.repeat(np.arange(256)[:, np.newaxis], 3, axis=1)
+    summary = summarize(greys, hueBins)
+    assert np.all(summary['hue_witness'] == -1), np.flatnonzero(summary['hue_witness'] >= 0)
+    assert summary['hue_histogram'].sum() == 0
+    print('greys leave every hue bin empty')
+
+    summary = sweepPlane(128, hueBins)
+    witnesses = np.array([indexColor(i) for i in summary['hue_witness'][summary['hue_witness'] >= 0].tolist()])
+    assert len(witnesses) and np.all((witnesses[:, 0] != witnesses[:, 1]) | (witnesses[:, 1] != witnesses[:, 2]))
+    print(f'red plane 128 fills {len(witnesses)} of {hueBins} hue bins, all with chromatic colors')
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='sweep.py', description='Exact JzAzBz/JzCzHz statistics over all 2**24 sRGB255 colors.')
+    parser.add_argument('--hue-bins', type=int, default=360, help='hue bins for the chroma maxima and hue histogram (default: 360)')
+    parser.add_argument('--accuracy', choices=jabznp.ACCURACY, default='exact', help='jabznp accuracy tier (default: exact)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--json', help='write the full results to this file')
+    args = parser.parse_args(argv)
+
+    t = time.perf_counter()
+    total = sweep(args.hue_bins, args.accuracy, args.workers, lambda done: print(f'\r{done}/256 planes', end='', file=sys.stderr))
+    print(file=sys.stderr)
+    result = report(total)
+    print(f'{result["count"]} colors in {time.perf_counter() - t:.1f}s on {args.workers or os.cpu_count()} workers')
+
+    for name, e in result['extremes'].items():
+        print(f'{name}: [{e["min"]!r}, {e["max"]!r}] at sRGB255 {e["min_srgb255"]}, {e["max_srgb255"]}')
+    width = 360/args.hue_bins
+    hueMax = result['hue_max_cz']
+    i = int(np.argmin(hueMax))
+    print(f'hue max cz ranges from {hueMax[i]:.6f} at {i*width - 180:.1f}..{(i + 1)*width - 180:.1f} degrees to {max(hueMax):.6f}')
+    for name, value in result['constants'].items():
+        print(f'{name} = {value}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['check']:
+        check()
+    else:
+        main(sys.argv[1:])